@@ -0,0 +1,140 @@
+"""
+Batch analytics across all users.
+
+Walks users in id order, in chunks, over a process pool: each chunk awards
+badges, stores insight snapshots and health scores, and stores spending
+forecasts, so the first dashboard view after a quiet night reads stored
+results instead of computing them. Progress is checkpointed in the
+analytics_run table; an interrupted run resumes after the last user whose
+chunk, and every chunk before it, finished.
+"""
+import logging
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from app import app, db
+from models import User, AnalyticsRun
+from badges import check_and_award_badges
+from snapshots import compute_snapshot
+from forecasts import forecast_users
+
+# Users handed to a worker at a time
+CHUNK_SIZE = 200
+
+def _init_worker():
+    # Connections inherited from the parent process must not be reused; each
+    # worker opens its own and keeps an app context for its lifetime
+    db.engine.dispose(close=False)
+    app.app_context().push()
+
+def analyze_users(user_ids: List[int]) -> Dict[str, int]:
+    """
+    Award badges, store insight snapshots and store forecasts for a chunk of users.
+
+    A user that fails is logged and counted without stopping the chunk.
+
+    Returns:
+        Dict with the number of users, failures, badges awarded and
+        forecasts stored
+    """
+    summary = {'users': len(user_ids), 'failed': 0, 'badges': 0, 'forecasts': 0}
+
+    for user_id in user_ids:
+        try:
+            # Awarding bumps the data version, so badges go before the snapshot
+            summary['badges'] += len(check_and_award_badges(user_id))
+            compute_snapshot(user_id)
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Analytics error for user {user_id}: {e}")
+            summary['failed'] += 1
+
+    try:
+        summary['forecasts'] = forecast_users(user_ids)
+    except Exception as e:
+        logging.error(f"Forecast error for users {user_ids[0]}-{user_ids[-1]}: {e}")
+        summary['failed'] = len(user_ids)
+
+    db.session.remove()
+    return summary
+
+def _start_run(restart: bool) -> AnalyticsRun:
+    """Return the unfinished run to resume, or start a new one."""
+    run = AnalyticsRun.query.filter_by(status='running').order_by(AnalyticsRun.id.desc()).first()
+    if run and restart:
+        run.status = 'abandoned'
+        run = None
+    if run is None:
+        run = AnalyticsRun(status='running', last_user_id=0, users_processed=0, users_failed=0)
+        db.session.add(run)
+    db.session.commit()
+    return run
+
+def run_analytics(workers: Optional[int] = None, chunk_size: int = CHUNK_SIZE, restart: bool = False,
+                  progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """
+    Run batch analytics for every user not yet covered by the current run.
+
+    Args:
+        workers: Worker processes; 0 runs chunks in this process
+        chunk_size: Users per chunk
+        restart: Abandon an unfinished run instead of resuming it
+        progress: Called with the running totals after each chunk
+
+    Returns:
+        Dict with the run id, the totals of this invocation, the elapsed
+        seconds and the throughput in users per second
+    """
+    workers = app.config['ANALYTICS_PROCESSES'] if workers is None else workers
+    run = _start_run(restart)
+    run_id = run.id
+
+    user_ids = [row[0] for row in db.session.query(User.id).filter(User.id > run.last_user_id).order_by(User.id)]
+    chunks = [user_ids[start:start + chunk_size] for start in range(0, len(user_ids), chunk_size)]
+    totals = {'run_id': run_id, 'resumed_after': run.last_user_id, 'users': 0, 'failed': 0, 'badges': 0, 'forecasts': 0}
+    started = time.monotonic()
+
+    def checkpoint(chunk, summary):
+        for key in ('users', 'failed', 'badges', 'forecasts'):
+            totals[key] += summary[key]
+        run = db.session.get(AnalyticsRun, run_id)
+        run.last_user_id = chunk[-1]
+        run.users_processed += summary['users']
+        run.users_failed += summary['failed']
+        db.session.commit()
+        if progress:
+            progress(totals)
+
+    if workers and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            # Keep a few chunks queued per worker and collect them in order, so
+            # the checkpoint only ever moves past chunks that have all finished
+            pending = deque()
+            remaining = iter(chunks)
+            for chunk in remaining:
+                pending.append((chunk, pool.submit(analyze_users, chunk)))
+                if len(pending) >= workers * 2:
+                    break
+            while pending:
+                chunk, future = pending.popleft()
+                checkpoint(chunk, future.result())
+                next_chunk = next(remaining, None)
+                if next_chunk is not None:
+                    pending.append((next_chunk, pool.submit(analyze_users, next_chunk)))
+    else:
+        for chunk in chunks:
+            checkpoint(chunk, analyze_users(chunk))
+
+    run = db.session.get(AnalyticsRun, run_id)
+    run.status = 'completed'
+    run.finished_at = datetime.utcnow()
+    db.session.commit()
+
+    totals['elapsed'] = time.monotonic() - started
+    totals['users_per_second'] = totals['users'] / totals['elapsed'] if totals['elapsed'] > 0 else 0.0
+    logging.info(f"Analytics run {run_id}: {totals['users']} users in {totals['elapsed']:.1f}s "
+                 f"({totals['users_per_second']:.1f} users/s), {totals['failed']} failed")
+    return totals
@@ -35,6 +35,28 @@ def create_app():
     app.config["UPLOAD_FOLDER"] = "uploads"
     app.config["REPORTS_FOLDER"] = "reports"
     app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB max file size
+    app.config["MAX_STREAM_CONTENT_LENGTH"] = None  # No limit for streamed CSV uploads
+    
+    # Background import jobs
+    app.config["IMPORT_WORKERS"] = int(os.environ.get("IMPORT_WORKERS", 2))
+    app.config["IMPORT_SPOOL_SIZE"] = 8 * 1024 * 1024  # Queued uploads, streamed ones included, beyond 8MB spool to a temp file
+    app.config["IMPORT_JOB_TIMEOUT"] = int(os.environ.get("IMPORT_JOB_TIMEOUT", 1800))  # Seconds a job may wait or run without progress before it is failed
+    app.config["IMPORT_PROCESSES"] = int(os.environ.get("IMPORT_PROCESSES", os.cpu_count() or 1))  # Parse zip members in parallel
+    app.config["MAX_ARCHIVE_MEMBERS"] = 1000
+    app.config["MAX_ARCHIVE_MEMBER_SIZE"] = 100 * 1024 * 1024  # 100MB uncompressed per file in a zip
+    app.config["MAX_ARCHIVE_SIZE"] = 1024 * 1024 * 1024  # 1GB uncompressed across a zip
+    
+    # Transactions API page sizes
+    app.config["API_PAGE_SIZE"] = 25
+    app.config["API_MAX_PAGE_SIZE"] = 100
+    
+    # Time-series charts are bucketed so they never have more points than this
+    app.config["TIMESERIES_MAX_POINTS"] = 60
+    
+    # Dashboard data cached per user until their data changes
+    app.config["DASHBOARD_CACHE_SIZE"] = int(os.environ.get("DASHBOARD_CACHE_SIZE", 1000))
+    app.config["INSIGHT_WORKERS"] = int(os.environ.get("INSIGHT_WORKERS", 1))  # Recompute stale insight snapshots
+    app.config["ANALYTICS_PROCESSES"] = int(os.environ.get("ANALYTICS_PROCESSES", os.cpu_count() or 1))  # Nightly batch analytics
     
     # Initialize extensions
     db.init_app(app)
@@ -53,16 +75,18 @@ def create_app():
 app = create_app()
 
 # Import models and routes after app creation
-from models import User, Transaction, Goal, Debt, Badge, UserBadge
+from models import User, Transaction, MonthlyRollup, CategoryRule, ImportJob, ImportJobError, Goal, Debt, Badge, UserBadge, SchemaMigration, InsightSnapshot, SpendingForecast, WeeklySpending, SpendingStats, SpendingAlert, AnalyticsRun
 
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
 
-# Create database tables
+# Create database tables and alter those that existed before the current models
 with app.app_context():
-    db.create_all()
+    from migrations import upgrade_database
+    upgrade_database()
     logging.info("Database tables created successfully")
 
-# Import routes
+# Import routes and CLI commands
 import routes
+import commands
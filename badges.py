@@ -1,9 +1,44 @@
 from datetime import datetime, timedelta
-from sqlalchemy import func
-from models import User, Transaction, Goal, Debt, Badge, UserBadge
+from sqlalchemy import func, or_
+from models import User, Transaction, Goal, Debt, Badge, UserBadge, bump_data_version
 from app import db
+from rollups import (get_totals, get_transaction_count, get_category_count,
+                     get_monthly_totals, get_month_totals)
 import logging
 
+# Events that can change whether a badge condition holds
+TRANSACTIONS_ADDED = 'transactions_added'
+TRANSACTIONS_DELETED = 'transactions_deleted'
+GOAL_CREATED = 'goal_created'
+GOAL_UPDATED = 'goal_updated'
+DEBT_CREATED = 'debt_created'
+DEBT_UPDATED = 'debt_updated'
+
+ALL_EVENTS = {TRANSACTIONS_ADDED, TRANSACTIONS_DELETED, GOAL_CREATED, GOAL_UPDATED, DEBT_CREATED, DEBT_UPDATED}
+
+# Badges are never revoked, so a condition only needs the events that can make it true.
+# Conditions that compare totals can also become true when an expense is deleted.
+# budget_control, expense_reduction and consistent_tracking depend on today's date and
+# can become true without any write; `flask nightly-analytics` (or `flask award-badges`)
+# checks every condition without an event and awards those.
+CONDITION_EVENTS = {
+    'first_transaction': {TRANSACTIONS_ADDED},
+    'first_income': {TRANSACTIONS_ADDED},
+    'consecutive_savings': {TRANSACTIONS_ADDED, TRANSACTIONS_DELETED},
+    'first_goal_completed': {GOAL_UPDATED},
+    'first_goal_set': {GOAL_CREATED},
+    'first_debt_added': {DEBT_CREATED},
+    'debt_paid_off': {DEBT_CREATED, DEBT_UPDATED},
+    'budget_control': {TRANSACTIONS_ADDED, TRANSACTIONS_DELETED},
+    'consistent_tracking': {TRANSACTIONS_ADDED},
+    'monthly_tracking': {TRANSACTIONS_ADDED},
+    'big_transaction': {TRANSACTIONS_ADDED},
+    'category_diversity': {TRANSACTIONS_ADDED},
+    'emergency_fund': {TRANSACTIONS_ADDED, TRANSACTIONS_DELETED},
+    'hundred_transactions': {TRANSACTIONS_ADDED},
+    'expense_reduction': {TRANSACTIONS_ADDED, TRANSACTIONS_DELETED},
+}
+
 def initialize_badges():
     """Initialize the badge system with predefined badges"""
     badges_data = [
@@ -117,8 +152,8 @@ def initialize_badges():
         db.session.rollback()
         logging.error(f"Error initializing badges: {e}")
 
-def check_and_award_badges(user_id):
-    """Check if user has earned any new badges and award them"""
+def check_and_award_badges(user_id, event=None):
+    """Check if user has earned any new badges, only those affected by event if given, and award them"""
     user = User.query.get(user_id)
     if not user:
         return []
@@ -134,6 +169,9 @@ def check_and_award_badges(user_id):
         if badge.id in earned_badge_ids:
             continue  # Already earned
         
+        if event and event not in CONDITION_EVENTS.get(badge.condition, ALL_EVENTS):
+            continue  # Cannot have changed
+        
         if check_badge_condition(user_id, badge.condition):
             # Award badge
             user_badge = UserBadge(user_id=user_id, badge_id=badge.id)
@@ -142,6 +180,7 @@ def check_and_award_badges(user_id):
     
     if newly_earned:
         try:
+            bump_data_version(user_id)
             db.session.commit()
             logging.info(f"User {user_id} earned badges: {newly_earned}")
         except Exception as e:
@@ -154,7 +193,7 @@ def check_badge_condition(user_id, condition):
     """Check if a specific badge condition is met"""
     try:
         if condition == 'first_transaction':
-            return Transaction.query.filter_by(user_id=user_id).count() >= 1
+            return get_transaction_count(user_id) >= 1
         
         elif condition == 'first_income':
             return Transaction.query.filter(
@@ -164,15 +203,15 @@ def check_badge_condition(user_id, condition):
         
         elif condition == 'consecutive_savings':
             # Check if user has positive savings for 3 consecutive months
-            transactions = Transaction.query.filter_by(user_id=user_id).all()
-            if not transactions:
+            monthly_totals = get_monthly_totals(user_id)
+            if not monthly_totals:
                 return False
             
-            # Group by month and calculate net savings
-            monthly_savings = {}
-            for transaction in transactions:
-                month_key = transaction.date.strftime('%Y-%m')
-                monthly_savings[month_key] = monthly_savings.get(month_key, 0) + transaction.amount
+            # Net savings per month from the rollup
+            monthly_savings = {
+                month_key: totals['income'] - totals['expenses']
+                for month_key, totals in monthly_totals.items()
+            }
             
             # Check for 3 consecutive months of positive savings
             sorted_months = sorted(monthly_savings.keys())
@@ -205,92 +244,69 @@ def check_badge_condition(user_id, condition):
         
         elif condition == 'budget_control':
             # Check if expenses were under a reasonable limit last month
-            last_month_start = datetime.now().replace(day=1) - timedelta(days=1)
-            last_month_start = last_month_start.replace(day=1)
             last_month_end = datetime.now().replace(day=1) - timedelta(days=1)
+            last_month = get_month_totals(user_id, last_month_end.year, last_month_end.month)
             
-            monthly_expenses = Transaction.query.filter(
-                Transaction.user_id == user_id,
-                Transaction.date >= last_month_start.date(),
-                Transaction.date <= last_month_end.date(),
-                Transaction.amount < 0
-            ).all()
-            
-            if not monthly_expenses:
+            if not last_month['expense_count']:
                 return False
             
-            total_expenses = sum(abs(t.amount) for t in monthly_expenses)
-            monthly_income = Transaction.query.filter(
-                Transaction.user_id == user_id,
-                Transaction.date >= last_month_start.date(),
-                Transaction.date <= last_month_end.date(),
-                Transaction.amount > 0
-            ).all()
-            
-            total_income = sum(t.amount for t in monthly_income)
+            total_expenses = last_month['expenses']
+            total_income = last_month['income']
             
             # Budget control: expenses less than 80% of income
             return total_income > 0 and total_expenses < (total_income * 0.8)
         
         elif condition == 'consistent_tracking':
-            # Check if user has transactions in last 30 days
+            # Check if there are transactions in at least 20 of the last 30 days
             thirty_days_ago = datetime.now().date() - timedelta(days=30)
-            recent_transactions = Transaction.query.filter(
+            transaction_days = db.session.query(func.count(func.distinct(Transaction.date))).filter(
                 Transaction.user_id == user_id,
                 Transaction.date >= thirty_days_ago
-            ).all()
-            
-            # Check if there are transactions in at least 20 of the last 30 days
-            transaction_dates = set(t.date for t in recent_transactions)
-            return len(transaction_dates) >= 20
+            ).scalar()
+            return transaction_days >= 20
         
         elif condition == 'monthly_tracking':
             # Check if user has transactions spanning at least 30 days
-            transactions = Transaction.query.filter_by(user_id=user_id).all()
-            if len(transactions) < 10:
+            count, first_date, last_date = db.session.query(
+                func.count(Transaction.id), func.min(Transaction.date), func.max(Transaction.date)
+            ).filter(Transaction.user_id == user_id).one()
+            if count < 10:
                 return False
             
-            dates = [t.date for t in transactions]
-            date_range = max(dates) - min(dates)
-            return date_range.days >= 30
+            return (last_date - first_date).days >= 30
         
         elif condition == 'big_transaction':
+            # Compare the column directly so the (user_id, amount) index applies
             return Transaction.query.filter(
                 Transaction.user_id == user_id,
-                func.abs(Transaction.amount) >= 1000
+                or_(Transaction.amount >= 1000, Transaction.amount <= -1000)
             ).count() >= 1
         
         elif condition == 'category_diversity':
-            categories = db.session.query(Transaction.category).filter_by(user_id=user_id).distinct().all()
-            return len(categories) >= 10
+            return get_category_count(user_id) >= 10
         
         elif condition == 'emergency_fund':
             # Check if user has savings worth 3 months of expenses
-            transactions = Transaction.query.filter_by(user_id=user_id).all()
-            if not transactions:
+            monthly_totals = get_monthly_totals(user_id)
+            if not monthly_totals:
                 return False
             
             # Calculate average monthly expenses
-            monthly_expenses = {}
-            for transaction in transactions:
-                if transaction.amount < 0:
-                    month_key = transaction.date.strftime('%Y-%m')
-                    monthly_expenses[month_key] = monthly_expenses.get(month_key, 0) + abs(transaction.amount)
+            monthly_expenses = [totals['expenses'] for totals in monthly_totals.values() if totals['expense_count']]
             
             if not monthly_expenses:
                 return False
             
-            avg_monthly_expenses = sum(monthly_expenses.values()) / len(monthly_expenses)
+            avg_monthly_expenses = sum(monthly_expenses) / len(monthly_expenses)
             
             # Calculate total savings
-            total_savings = sum(t.amount for t in transactions if t.amount > 0)
-            total_expenses = sum(abs(t.amount) for t in transactions if t.amount < 0)
+            total_savings, total_expenses = get_totals(user_id)
             net_savings = total_savings - total_expenses
             
             return net_savings >= (avg_monthly_expenses * 3)
         
         elif condition == 'hundred_transactions':
-            return Transaction.query.filter_by(user_id=user_id).count() >= 100
+            return get_transaction_count(user_id) >= 100
         
         elif condition == 'expense_reduction':
             # Check if user reduced expenses by 20% from previous month
@@ -299,25 +315,14 @@ def check_badge_condition(user_id, condition):
             last_month = current_month - 1 if current_month > 1 else 12
             last_month_year = current_year if current_month > 1 else current_year - 1
             
-            current_expenses = Transaction.query.filter(
-                Transaction.user_id == user_id,
-                func.extract('month', Transaction.date) == current_month,
-                func.extract('year', Transaction.date) == current_year,
-                Transaction.amount < 0
-            ).all()
-            
-            last_month_expenses = Transaction.query.filter(
-                Transaction.user_id == user_id,
-                func.extract('month', Transaction.date) == last_month,
-                func.extract('year', Transaction.date) == last_month_year,
-                Transaction.amount < 0
-            ).all()
+            current_expenses = get_month_totals(user_id, current_year, current_month)
+            last_month_expenses = get_month_totals(user_id, last_month_year, last_month)
             
-            if not current_expenses or not last_month_expenses:
+            if not current_expenses['expense_count'] or not last_month_expenses['expense_count']:
                 return False
             
-            current_total = sum(abs(t.amount) for t in current_expenses)
-            last_month_total = sum(abs(t.amount) for t in last_month_expenses)
+            current_total = current_expenses['expenses']
+            last_month_total = last_month_expenses['expenses']
             
             if last_month_total == 0:
                 return False
@@ -356,16 +361,15 @@ def calculate_badge_progress(user_id, condition):
     """Calculate progress percentage for a badge condition"""
     try:
         if condition == 'first_transaction':
-            count = Transaction.query.filter_by(user_id=user_id).count()
+            count = get_transaction_count(user_id)
             return min(100, count * 100)
         
         elif condition == 'hundred_transactions':
-            count = Transaction.query.filter_by(user_id=user_id).count()
+            count = get_transaction_count(user_id)
             return min(100, count)
         
         elif condition == 'category_diversity':
-            categories = db.session.query(Transaction.category).filter_by(user_id=user_id).distinct().all()
-            return min(100, len(categories) * 10)
+            return min(100, get_category_count(user_id) * 10)
         
         elif condition == 'first_goal_completed':
             completed_goals = Goal.query.filter_by(user_id=user_id, is_completed=True).count()
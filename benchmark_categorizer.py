@@ -0,0 +1,215 @@
+"""
+Throughput and accuracy benchmark for categorizer.py.
+
+Builds a large labeled corpus by expanding the sample transactions with
+merchant templates and noise, measures descriptions/sec for every
+categorization path and evaluates accuracy across a process pool.
+
+Usage:
+    python benchmark_categorizer.py --rows 1000000 --workers 8
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+import categorizer
+
+SAMPLE_CSV = os.path.join('static', 'sample_data', 'sample_transactions.csv')
+
+# Merchant names and description templates with a known category
+MERCHANT_TEMPLATES = {
+    'Food & Dining': (
+        ['Starbucks', 'Chipotle', 'Whole Foods', 'Trader Joes', 'Panera Bread', 'Dominos Pizza', 'Local Bakery'],
+        ['Coffee at {merchant}', 'Lunch at {merchant}', 'Grocery shopping at {merchant}', 'Dinner at {merchant}']
+    ),
+    'Transportation': (
+        ['Shell', 'Chevron', 'Uber', 'Lyft', 'City Parking'],
+        ['Gas station fill-up at {merchant}', '{merchant} ride to airport', 'Parking fee {merchant}']
+    ),
+    'Shopping': (
+        ['Amazon', 'Best Buy', 'Nike Store', 'Macys'],
+        ['Online order {merchant}', 'Purchase at {merchant}', '{merchant} clothing']
+    ),
+    'Entertainment': (
+        ['Netflix', 'AMC Theaters', 'Spotify', 'Bowling Alley'],
+        ['Movie tickets at {merchant}', '{merchant} concert tickets', 'Night out at {merchant}']
+    ),
+    'Utilities': (
+        ['Comcast', 'PG&E', 'Verizon', 'City Water'],
+        ['Electric bill payment to {merchant}', 'Internet bill {merchant}', '{merchant} phone bill']
+    ),
+    'Healthcare': (
+        ['CVS Pharmacy', 'Walgreens', 'City Clinic', 'Dental Associates'],
+        ['Prescription pickup at {merchant}', 'Doctor visit {merchant}', '{merchant} dentist checkup']
+    ),
+    'Travel': (
+        ['Marriott', 'Delta', 'Airbnb', 'Expedia'],
+        ['Hotel stay {merchant}', 'Flight booking {merchant}', '{merchant} vacation booking']
+    ),
+    'Income': (
+        ['TechCorp Inc', 'Acme LLC', 'Client Project'],
+        ['Salary deposit from {merchant}', 'Freelance payment {merchant}', 'Bonus paycheck {merchant}']
+    ),
+    'Personal Care': (
+        ['Planet Fitness', 'Great Clips', 'Day Spa'],
+        ['Haircut at {merchant}', '{merchant} gym', 'Massage at {merchant}']
+    ),
+}
+
+def load_sample_descriptions(path: str = SAMPLE_CSV) -> List[Dict]:
+    """Load sample transactions labeled with a category column if present."""
+    with open(path, newline='') as csvfile:
+        rows = list(csv.DictReader(csvfile))
+
+    # Without labels, the current rules on clean text are the reference
+    return [{
+        'description': row['description'],
+        'category': row.get('category') or categorizer.categorize_transaction(row['description'])
+    } for row in rows]
+
+def add_noise(description: str, rng: random.Random) -> str:
+    """Apply bank-export style noise to a description."""
+    choice = rng.random()
+    if choice < 0.2:
+        description = description.upper()
+    elif choice < 0.35:
+        description = f'POS {description} #{rng.randint(1000, 99999)}'
+    elif choice < 0.5:
+        description = f'{description} {rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}'
+    elif choice < 0.6:
+        description = f'  {description}   '
+    elif choice < 0.7:
+        description = f'{description} REF{rng.randint(10 ** 7, 10 ** 8)}'
+    return description
+
+def generate_corpus(rows: int, seed: int = 42, labels_path: str = SAMPLE_CSV) -> pd.DataFrame:
+    """
+    Generate a labeled description corpus.
+
+    Args:
+        rows: Number of descriptions to generate
+        seed: Random seed for reproducible corpora
+        labels_path: CSV with description (and optionally category) columns
+
+    Returns:
+        DataFrame with 'description' and 'category' columns
+    """
+    rng = random.Random(seed)
+    base = load_sample_descriptions(labels_path)
+    for category, (merchants, templates) in MERCHANT_TEMPLATES.items():
+        for merchant in merchants:
+            for template in templates:
+                base.append({'description': template.format(merchant=merchant), 'category': category})
+
+    descriptions = []
+    categories = []
+    for _ in range(rows):
+        item = rng.choice(base)
+        descriptions.append(add_noise(item['description'], rng))
+        categories.append(item['category'])
+
+    return pd.DataFrame({'description': descriptions, 'category': categories})
+
+def measure(label: str, func, count: int) -> Dict:
+    """Time a callable that processes ``count`` descriptions."""
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else 0
+    print(f'{label:<40} {count:>10} rows {elapsed:>8.2f}s {rate:>12,.0f} desc/s')
+    return {'name': label, 'rows': count, 'seconds': elapsed, 'per_second': rate}
+
+def _evaluate_chunk(records: List[Dict]) -> Dict:
+    return categorizer.analyze_categorization_accuracy(records)
+
+def parallel_accuracy(corpus: pd.DataFrame, workers: int, chunk_size: int) -> Tuple[Dict, float]:
+    """
+    Run analyze_categorization_accuracy over the corpus in a process pool.
+
+    Returns:
+        Tuple of combined accuracy statistics and elapsed seconds
+    """
+    records = corpus.to_dict('records')
+    chunks = [records[i:i + chunk_size] for i in range(0, len(records), chunk_size)]
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_evaluate_chunk, chunks))
+    elapsed = time.perf_counter() - start
+
+    total = sum(result['total'] for result in results)
+    correct = sum(result['correct'] for result in results)
+    return {
+        'accuracy': (correct / total) * 100 if total > 0 else 0,
+        'total': total,
+        'correct': correct,
+        'incorrect': total - correct
+    }, elapsed
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000, help='Size of the generated corpus')
+    parser.add_argument('--timing-rows', type=int, default=20000,
+                        help='Rows used for the per-description timing loops')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Processes used for the accuracy evaluation')
+    parser.add_argument('--chunk-size', type=int, default=20000, help='Rows per accuracy task')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--labels', default=SAMPLE_CSV, help='CSV of descriptions to expand')
+    parser.add_argument('--min-accuracy', type=float, default=None,
+                        help='Exit with an error when accuracy falls below this percentage')
+    parser.add_argument('--json', dest='json_path', default=None, help='Write results to this file')
+    args = parser.parse_args(argv)
+
+    corpus = generate_corpus(args.rows, seed=args.seed, labels_path=args.labels)
+    sample = corpus['description'].head(args.timing_rows).tolist()
+    unique_count = corpus['description'].nunique()
+    print(f'Corpus: {len(corpus):,} descriptions, {unique_count:,} distinct')
+
+    throughput = []
+
+    categorizer.clear_categorization_cache()
+    throughput.append(measure('categorize_transaction (cold cache)',
+                              lambda: [categorizer.categorize_transaction(d) for d in sample], len(sample)))
+    throughput.append(measure('categorize_transaction (warm cache)',
+                              lambda: [categorizer.categorize_transaction(d) for d in sample], len(sample)))
+    throughput.append(measure('get_category_suggestions',
+                              lambda: [categorizer.get_category_suggestions(d) for d in sample], len(sample)))
+    throughput.append(measure('categorize_many',
+                              lambda: categorizer.categorize_many(corpus['description']), len(corpus)))
+
+    cache_stats = categorizer.get_cache_stats()
+    print(f"Cache: {cache_stats['hits']:,} hits, {cache_stats['misses']:,} misses "
+          f"({cache_stats['hit_rate']:.1f}% hit rate)")
+
+    accuracy, elapsed = parallel_accuracy(corpus, args.workers, args.chunk_size)
+    rate = accuracy['total'] / elapsed if elapsed > 0 else 0
+    print(f"Accuracy: {accuracy['accuracy']:.2f}% ({accuracy['correct']:,}/{accuracy['total']:,}) "
+          f"in {elapsed:.2f}s across {args.workers} workers ({rate:,.0f} desc/s)")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as output:
+            json.dump({
+                'rows': len(corpus),
+                'distinct': int(unique_count),
+                'throughput': throughput,
+                'cache': cache_stats,
+                'accuracy': accuracy
+            }, output, indent=2)
+
+    if args.min_accuracy is not None and accuracy['accuracy'] < args.min_accuracy:
+        print(f'Accuracy below minimum of {args.min_accuracy:.2f}%', file=sys.stderr)
+        return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
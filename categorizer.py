@@ -1,5 +1,12 @@
 import re
-from typing import Dict, List
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import ml_categorizer
 
 # Transaction categorization rules
 CATEGORY_KEYWORDS = {
@@ -130,12 +137,326 @@ CATEGORY_KEYWORDS = {
     ]
 }
 
-def categorize_transaction(description: str) -> str:
+def _is_word_char(char: str) -> bool:
+    """Match the semantics of ``\\w`` in Python's ``re`` module."""
+    return char.isalnum() or char == '_'
+
+class _KeywordMatcher:
+    """
+    Aho-Corasick automaton over every keyword in a category rule set.
+
+    A single left-to-right pass over a description reports every keyword
+    occurrence, including overlapping ones, so scoring no longer needs a
+    substring test and a fresh regex per keyword.
+    """
+
+    def __init__(self, category_keywords: Dict[str, List[str]]):
+        self.categories = list(category_keywords.keys())
+        self.keywords: List[str] = []
+        # keyword id -> list of (category index, times listed in that category)
+        self.owners: List[List[Tuple[int, int]]] = []
+        # Empty keywords cannot be matched by the automaton; they are
+        # scored separately to keep the substring semantics of ''.
+        self.empty_owners: List[Tuple[int, int]] = []
+
+        keyword_ids: Dict[str, int] = {}
+        for category_index, category in enumerate(self.categories):
+            counts: Dict[str, int] = {}
+            for keyword in category_keywords[category]:
+                counts[keyword] = counts.get(keyword, 0) + 1
+            for keyword, count in counts.items():
+                if not keyword:
+                    self.empty_owners.append((category_index, count))
+                    continue
+                if keyword not in keyword_ids:
+                    keyword_ids[keyword] = len(self.keywords)
+                    self.keywords.append(keyword)
+                    self.owners.append([])
+                self.owners[keyword_ids[keyword]].append((category_index, count))
+
+        self._build()
+
+    def _build(self) -> None:
+        goto: List[Dict[str, int]] = [{}]
+        output: List[List[int]] = [[]]
+
+        for keyword_id, keyword in enumerate(self.keywords):
+            state = 0
+            for char in keyword:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    output.append([])
+                state = next_state
+            output[state].append(keyword_id)
+
+        # Breadth-first pass to compute failure links, folding them into a
+        # complete transition table so matching never has to backtrack.
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict(goto[0])]
+        delta.extend({} for _ in range(len(goto) - 1))
+        queue = list(goto[0].values())
+        position = 0
+        while position < len(queue):
+            state = queue[position]
+            position += 1
+            output[state] = output[state] + output[fail[state]]
+            transitions = dict(delta[fail[state]])
+            for char, next_state in goto[state].items():
+                fail[next_state] = delta[fail[state]].get(char, 0)
+                transitions[char] = next_state
+                queue.append(next_state)
+            delta[state] = transitions
+
+        self._delta = delta
+        self._output = output
+
+    def find(self, text: str) -> Dict[int, bool]:
+        """
+        Find every keyword occurring in ``text``.
+
+        Returns:
+            Mapping of keyword id to whether any occurrence sits on word
+            boundaries (the equivalent of ``re.search(r'\\bkw\\b', text)``)
+        """
+        delta = self._delta
+        output = self._output
+        keywords = self.keywords
+        hits: Dict[int, bool] = {}
+        state = 0
+
+        for end, char in enumerate(text):
+            state = delta[state].get(char, 0)
+            if not output[state]:
+                continue
+            for keyword_id in output[state]:
+                if hits.get(keyword_id):
+                    continue
+                keyword = keywords[keyword_id]
+                start = end - len(keyword) + 1
+                before = _is_word_char(text[start - 1]) if start > 0 else False
+                after = _is_word_char(text[end + 1]) if end + 1 < len(text) else False
+                hits[keyword_id] = (before != _is_word_char(keyword[0]) and
+                                    after != _is_word_char(keyword[-1]))
+
+        return hits
+
+    def score(self, desc_lower: str) -> Dict[str, int]:
+        """
+        Score every category against a normalized description.
+
+        Exact matches are worth 10, word boundary matches 5 and partial
+        matches 1, counted once per time the keyword is listed.
+
+        Returns:
+            Dictionary of category name to score, in rule order, omitting
+            categories that did not match
+        """
+        scores = [0] * len(self.categories)
+
+        for keyword_id, on_boundary in self.find(desc_lower).items():
+            keyword = self.keywords[keyword_id]
+            if keyword == desc_lower:
+                points = 10
+            elif on_boundary:
+                points = 5
+            else:
+                points = 1
+            for category_index, count in self.owners[keyword_id]:
+                scores[category_index] += points * count
+
+        if self.empty_owners:
+            if not desc_lower:
+                points = 10
+            elif re.search(r'\b', desc_lower):
+                points = 5
+            else:
+                points = 1
+            for category_index, count in self.empty_owners:
+                scores[category_index] += points * count
+
+        return {category: score for category, score in zip(self.categories, scores) if score > 0}
+
+# Number of distinct normalized descriptions whose scores are memoized
+CATEGORIZATION_CACHE_SIZE = 10000
+
+# Number of per-user compiled matchers kept by each worker process
+USER_MATCHER_CACHE_SIZE = 256
+
+# Bumped whenever the keyword rules change; compiled matchers and cached
+# scores built under an older version are discarded on next use.
+_rules_version = 0
+_matcher = None
+_matcher_version = -1
+_user_matchers: "OrderedDict[int, Tuple[tuple, _KeywordMatcher, _KeywordMatcher]]" = OrderedDict()
+_score_cache: "OrderedDict[tuple, Dict[str, int]]" = OrderedDict()
+_score_cache_version = 0
+_cache_hits = 0
+_cache_misses = 0
+_cache_lock = threading.Lock()
+
+def _get_matcher() -> _KeywordMatcher:
+    """Return the compiled matcher, rebuilding it after rule changes."""
+    global _matcher, _matcher_version
+    if _matcher is None or _matcher_version != _rules_version:
+        version = _rules_version
+        _matcher = _KeywordMatcher(CATEGORY_KEYWORDS)
+        _matcher_version = version
+    return _matcher
+
+def _bump_rules_version() -> None:
+    """Mark the keyword rules as changed."""
+    global _rules_version
+    _rules_version += 1
+
+def _get_user_rules_version(user_id: int) -> tuple:
+    """
+    Identify the current state of a user's stored rules.
+
+    Rule ids are never reused, so the rule count and highest id change
+    whenever rules are added or removed, from any worker.
+    """
+    from sqlalchemy import func
+    from app import db
+    from models import CategoryRule
+
+    count, max_id = db.session.query(
+        func.count(CategoryRule.id), func.max(CategoryRule.id)
+    ).filter(CategoryRule.user_id == user_id).one()
+    return (count, max_id)
+
+def load_rules(user_id: Optional[int] = None) -> Tuple[tuple, _KeywordMatcher, Optional[_KeywordMatcher]]:
+    """
+    Get the matcher for the global rules layered with a user's own rules.
+
+    Checking whether a user's rules changed costs a database query, so
+    callers categorizing descriptions one at a time should load the rules
+    once per request or batch and pass them to categorize_transaction.
+
+    Returns:
+        Tuple of a key identifying the rule set, its compiled matcher and a
+        matcher of the user's own rules alone, or None without any
+    """
+    if user_id is None:
+        return (), _get_matcher(), None
+
+    user_version = _get_user_rules_version(user_id)
+    if user_version[0] == 0:
+        return (), _get_matcher(), None
+
+    version = (user_id, _rules_version) + user_version
+    with _cache_lock:
+        cached = _user_matchers.get(user_id)
+        if cached is not None and cached[0] == version:
+            _user_matchers.move_to_end(user_id)
+            return cached
+
+    from models import CategoryRule
+
+    rules = {category: list(keywords) for category, keywords in CATEGORY_KEYWORDS.items()}
+    user_rules = {}
+    for rule in CategoryRule.query.filter_by(user_id=user_id).order_by(CategoryRule.id).all():
+        rules.setdefault(rule.category, []).append(rule.keyword)
+        user_rules.setdefault(rule.category, []).append(rule.keyword)
+    entry = (version, _KeywordMatcher(rules), _KeywordMatcher(user_rules))
+
+    with _cache_lock:
+        _user_matchers[user_id] = entry
+        _user_matchers.move_to_end(user_id)
+        while len(_user_matchers) > USER_MATCHER_CACHE_SIZE:
+            _user_matchers.popitem(last=False)
+
+    return entry
+
+def _score_description(desc_lower: str, rules_key: tuple, matcher: _KeywordMatcher) -> Dict[str, int]:
+    """
+    Score a normalized description, memoizing results in a bounded LRU cache.
+
+    The returned dictionary is shared with the cache and must not be mutated.
+    """
+    global _score_cache_version, _cache_hits, _cache_misses
+
+    key = (rules_key, desc_lower)
+    with _cache_lock:
+        if _score_cache_version != _rules_version:
+            _score_cache.clear()
+            _score_cache_version = _rules_version
+        version = _score_cache_version
+        scores = _score_cache.get(key)
+        if scores is not None:
+            _score_cache.move_to_end(key)
+            _cache_hits += 1
+            return scores
+        _cache_misses += 1
+
+    scores = matcher.score(desc_lower)
+
+    with _cache_lock:
+        if version == _rules_version:
+            _score_cache[key] = scores
+            while len(_score_cache) > CATEGORIZATION_CACHE_SIZE:
+                _score_cache.popitem(last=False)
+
+    return scores
+
+class _ModelScorer:
+    """Scores a description 1 for the learned model's confident prediction, so it can be cached like keyword scores."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def score(self, desc_lower: str) -> Dict[str, int]:
+        predicted = ml_categorizer.predict_categories(pd.Series([desc_lower]), self.model).iloc[0]
+        return {predicted: 1} if predicted is not None else {}
+
+def _predict_description(desc_lower: str, model) -> Optional[str]:
+    """Predict a category with the learned model, memoized in the score cache."""
+    # Keyed on the model file version so a retrained model is not answered from the cache
+    rules_key = ('model', ml_categorizer.model_version())
+    prediction = _score_description(desc_lower, rules_key, _ModelScorer(model))
+    return next(iter(prediction), None)
+
+def get_cache_stats() -> Dict:
+    """
+    Get hit/miss statistics for the categorization cache.
+    
+    Returns:
+        Dictionary with hits, misses, hit rate, current size and capacity
+    """
+    with _cache_lock:
+        lookups = _cache_hits + _cache_misses
+        return {
+            'hits': _cache_hits,
+            'misses': _cache_misses,
+            'hit_rate': (_cache_hits / lookups) * 100 if lookups > 0 else 0,
+            'size': len(_score_cache),
+            'max_size': CATEGORIZATION_CACHE_SIZE,
+            'rules_version': _rules_version
+        }
+
+def clear_categorization_cache() -> None:
+    """Empty the categorization cache and reset its counters."""
+    global _cache_hits, _cache_misses
+    with _cache_lock:
+        _score_cache.clear()
+        _cache_hits = 0
+        _cache_misses = 0
+
+def categorize_transaction(description: str, user_id: Optional[int] = None, rules: Optional[tuple] = None) -> str:
     """
     Categorize a transaction based on its description.
     
+    A user's custom rules are scored together with the global rules. When
+    any of the user's rules match, those combined scores decide and the
+    learned model is not consulted; otherwise a confident model prediction
+    is preferred over the global rules.
+    
     Args:
         description: Transaction description string
+        user_id: Apply this user's custom rules on top of the global rules
+        rules: Rules from load_rules, to avoid loading them for every call
         
     Returns:
         Category name as string
@@ -146,26 +467,23 @@ def categorize_transaction(description: str) -> str:
     # Convert to lowercase for matching
     desc_lower = description.lower().strip()
     
-    # Check each category for keyword matches
-    category_scores = {}
+    rules_key, matcher, user_matcher = rules or load_rules(user_id)
     
-    for category, keywords in CATEGORY_KEYWORDS.items():
-        score = 0
-        for keyword in keywords:
-            if keyword in desc_lower:
-                # Give higher weight to exact matches
-                if keyword == desc_lower:
-                    score += 10
-                # Give medium weight to word boundary matches
-                elif re.search(r'\b' + re.escape(keyword) + r'\b', desc_lower):
-                    score += 5
-                # Give lower weight to partial matches
-                else:
-                    score += 1
-        
-        if score > 0:
-            category_scores[category] = score
+    # A matching rule of the user's own decides over the shared model
+    own_match = user_matcher is not None and _score_description(desc_lower, rules_key + ('own',), user_matcher)
+    
+    # Prefer a confident prediction from the learned model when one is trained
+    model = ml_categorizer.get_model() if not own_match else None
+    if model is not None:
+        predicted = _predict_description(desc_lower, model)
+        if predicted is not None:
+            return predicted
     
+    # Score every category (memoized per normalized description)
+    return _categorize_scores(desc_lower, _score_description(desc_lower, rules_key, matcher))
+
+def _categorize_scores(desc_lower: str, category_scores: Dict[str, int]) -> str:
+    """Pick a category from keyword scores, falling back to common patterns."""
     # Return the category with the highest score
     if category_scores:
         return max(category_scores, key=category_scores.get)
@@ -188,12 +506,55 @@ def categorize_transaction(description: str) -> str:
     
     return 'Other'
 
-def get_category_suggestions(description: str) -> List[str]:
+def categorize_many(descriptions: pd.Series, user_id: Optional[int] = None) -> pd.Series:
+    """
+    Categorize a whole column of transaction descriptions at once.
+    
+    Descriptions are normalized with vectorized string operations and
+    deduplicated, so each distinct description is scored only once no
+    matter how many rows repeat it.
+    
+    Args:
+        descriptions: Series of transaction description strings
+        user_id: Apply this user's custom rules on top of the global rules
+        
+    Returns:
+        Series of category names aligned with the input index
+    """
+    text = descriptions.fillna('').astype(str)
+    missing = text == ''
+    normalized = text.str.lower().str.strip()
+    
+    codes, uniques = pd.factorize(normalized)
+    _, matcher, user_matcher = load_rules(user_id)
+    unique_categories = np.array(
+        [_categorize_scores(desc_lower, matcher.score(desc_lower)) for desc_lower in uniques],
+        dtype=object
+    )
+    
+    # Confident predictions from the learned model override the keyword rules,
+    # except where one of the user's own rules matched
+    model = ml_categorizer.get_model()
+    if model is not None:
+        predicted = ml_categorizer.predict_categories(pd.Series(uniques), model)
+        override = predicted.notna().to_numpy()
+        if user_matcher is not None:
+            override = override & np.array([not user_matcher.score(desc_lower) for desc_lower in uniques], dtype=bool)
+        unique_categories = np.where(override, predicted.values, unique_categories)
+    
+    categories = pd.Series(unique_categories[codes], index=descriptions.index, name='category')
+    categories[missing] = 'Other'
+    return categories
+
+def get_category_suggestions(description: str, user_id: Optional[int] = None,
+                             rules: Optional[tuple] = None) -> List[str]:
     """
     Get a list of suggested categories for a transaction description.
     
     Args:
         description: Transaction description string
+        user_id: Apply this user's custom rules on top of the global rules
+        rules: Rules from load_rules, to avoid loading them for every call
         
     Returns:
         List of suggested category names, sorted by relevance
@@ -202,21 +563,8 @@ def get_category_suggestions(description: str) -> List[str]:
         return ['Other']
     
     desc_lower = description.lower().strip()
-    category_scores = {}
-    
-    for category, keywords in CATEGORY_KEYWORDS.items():
-        score = 0
-        for keyword in keywords:
-            if keyword in desc_lower:
-                if keyword == desc_lower:
-                    score += 10
-                elif re.search(r'\b' + re.escape(keyword) + r'\b', desc_lower):
-                    score += 5
-                else:
-                    score += 1
-        
-        if score > 0:
-            category_scores[category] = score
+    rules_key, matcher, _ = rules or load_rules(user_id)
+    category_scores = _score_description(desc_lower, rules_key, matcher)
     
     # Sort by score and return top suggestions
     sorted_categories = sorted(category_scores.items(), key=lambda x: x[1], reverse=True)
@@ -227,27 +575,61 @@ def get_category_suggestions(description: str) -> List[str]:
     
     return suggestions
 
-def add_custom_category_rule(category: str, keywords: List[str]) -> None:
+def add_custom_category_rule(category: str, keywords: List[str], user_id: Optional[int] = None) -> None:
     """
     Add a custom category rule.
     
+    Rules for a user are stored in the database and only apply to that
+    user. Without a user the keywords are added to the global rules of the
+    current process.
+    
     Args:
         category: Category name
         keywords: List of keywords to match
+        user_id: Owner of the rule
     """
+    if user_id is not None:
+        from app import db
+        from models import CategoryRule
+        
+        existing = {
+            rule.keyword for rule in
+            CategoryRule.query.filter_by(user_id=user_id, category=category).all()
+        }
+        for keyword in keywords:
+            keyword = keyword.lower().strip()
+            if keyword and keyword not in existing:
+                db.session.add(CategoryRule(user_id=user_id, category=category, keyword=keyword))
+                existing.add(keyword)
+        db.session.commit()
+        return
+    
     if category not in CATEGORY_KEYWORDS:
         CATEGORY_KEYWORDS[category] = []
     
     CATEGORY_KEYWORDS[category].extend(keywords)
+    _bump_rules_version()
 
-def get_all_categories() -> List[str]:
+def get_all_categories(user_id: Optional[int] = None) -> List[str]:
     """
     Get all available categories.
     
+    Args:
+        user_id: Include categories from this user's custom rules
+    
     Returns:
         List of category names
     """
-    return list(CATEGORY_KEYWORDS.keys()) + ['Other']
+    categories = list(CATEGORY_KEYWORDS.keys())
+    
+    if user_id is not None:
+        from app import db
+        from models import CategoryRule
+        
+        user_categories = db.session.query(CategoryRule.category).filter_by(user_id=user_id).distinct().all()
+        categories += sorted(category for (category,) in user_categories if category not in CATEGORY_KEYWORDS)
+    
+    return categories + ['Other']
 
 def analyze_categorization_accuracy(transactions: List[Dict]) -> Dict:
     """
@@ -311,27 +693,62 @@ def get_category_statistics(transactions: List[Dict]) -> Dict:
         'total_amount': sum(category_amounts.values())
     }
 
-def improve_categorization(feedback: List[Dict]) -> None:
+def improve_categorization(feedback: List[Dict], user_id: Optional[int] = None) -> None:
     """
     Improve categorization based on user feedback.
     
+    A user's corrections become custom rules of that user, which are
+    scored with the global rules and take precedence over the model. Corrections without a user update the
+    shared learned model incrementally when one has been trained, and
+    otherwise the global keyword rules.
+    
     Args:
         feedback: List of dictionaries with 'description', 'predicted', 'actual' keys
+        user_id: User who gave the feedback
     """
-    # This could be used to train a machine learning model
-    # For now, we'll use rule-based improvements
+    corrections = [
+        item for item in feedback
+        if item.get('predicted', '') != item.get('actual', '') and item.get('actual', '') != 'Other'
+    ]
+    
+    # One user's corrections must not change the model shared by everyone
+    if user_id is not None:
+        known_categories = set(get_all_categories(user_id))
+        new_keywords = {}
+        for item in corrections:
+            actual = item.get('actual', '')
+            if actual in known_categories:
+                words = re.findall(r'\b\w+\b', item.get('description', '').lower())
+                new_keywords.setdefault(actual, []).extend(word for word in words if len(word) > 3)
+        for category, keywords in new_keywords.items():
+            add_custom_category_rule(category, keywords, user_id=user_id)
+        return
+    
+    # Update the learned model incrementally when one has been trained
+    learned = ml_categorizer.update_model(
+        [item.get('description', '') for item in corrections],
+        [item.get('actual', '') for item in corrections]
+    )
+    if learned:
+        learned_indexes = set(learned)
+        corrections = [item for i, item in enumerate(corrections) if i not in learned_indexes]
     
-    for item in feedback:
+    # Otherwise fall back to rule-based improvements
+    changed = False
+    
+    for item in corrections:
         description = item.get('description', '')
-        predicted = item.get('predicted', '')
         actual = item.get('actual', '')
         
-        if predicted != actual and actual != 'Other':
-            # Extract keywords from description for the correct category
-            words = re.findall(r'\b\w+\b', description.lower())
-            
-            # Add significant words to the correct category
-            if actual in CATEGORY_KEYWORDS:
-                for word in words:
-                    if len(word) > 3 and word not in CATEGORY_KEYWORDS[actual]:
-                        CATEGORY_KEYWORDS[actual].append(word)
+        # Extract keywords from description for the correct category
+        words = re.findall(r'\b\w+\b', description.lower())
+        
+        # Add significant words to the correct category
+        if actual in CATEGORY_KEYWORDS:
+            for word in words:
+                if len(word) > 3 and word not in CATEGORY_KEYWORDS[actual]:
+                    CATEGORY_KEYWORDS[actual].append(word)
+                    changed = True
+    
+    if changed:
+        _bump_rules_version()
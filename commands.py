@@ -0,0 +1,208 @@
+import logging
+import click
+import pandas as pd
+from app import app, db
+from models import User, Transaction
+from categorizer import get_all_categories
+import ml_categorizer
+
+@app.cli.command('train-categorizer')
+@click.option('--epochs', default=5, show_default=True, help='Passes over the labeled transactions.')
+@click.option('--path', default=ml_categorizer.MODEL_PATH, show_default=True, help='Where to save the model.')
+def train_categorizer(epochs, path):
+    """Train the learned categorizer from existing transaction categories."""
+    if not ml_categorizer.is_available():
+        raise click.ClickException('scikit-learn is required to train the categorizer.')
+    
+    # 'Other' only means no rule matched, so it is not a useful label
+    query = db.session.query(Transaction.description, Transaction.category).filter(
+        Transaction.category != 'Other'
+    )
+    df = pd.read_sql(query.statement, db.engine)
+    
+    if df.empty:
+        raise click.ClickException('No categorized transactions to train on.')
+    
+    classes = [category for category in get_all_categories() if category != 'Other']
+    model = ml_categorizer.train_model(df['description'], df['category'], classes, epochs=epochs)
+    ml_categorizer.save_model(model, path)
+    
+    logging.info(f"Trained categorizer on {len(df)} transactions")
+    click.echo(f'Trained categorizer on {len(df)} transactions and saved it to {path}.')
+
+@app.cli.command('backfill-fingerprints')
+@click.option('--batch-size', default=50000, show_default=True, help='Transactions fingerprinted per commit.')
+def backfill_fingerprints(batch_size):
+    """Fingerprint transactions imported before duplicate detection existed."""
+    from statement_parser import fingerprint_rows
+    
+    user_ids = [row[0] for row in db.session.query(Transaction.user_id).filter(
+        Transaction.fingerprint.is_(None)
+    ).distinct()]
+    
+    updated = 0
+    for user_id in user_ids:
+        # Continue numbering after occurrences that are already stored
+        existing = db.session.query(Transaction.fingerprint, db.func.max(Transaction.occurrence)).filter(
+            Transaction.user_id == user_id,
+            Transaction.fingerprint.isnot(None)
+        ).group_by(Transaction.fingerprint)
+        seen = {fingerprint: occurrence for fingerprint, occurrence in existing}
+        
+        query = db.session.query(
+            Transaction.id, Transaction.user_id, Transaction.date, Transaction.amount, Transaction.description
+        ).filter(
+            Transaction.user_id == user_id,
+            Transaction.fingerprint.is_(None)
+        ).order_by(Transaction.id)
+        df = pd.read_sql(query.statement, db.engine, parse_dates=['date'])
+        df['date'] = df['date'].dt.date
+        
+        for start in range(0, len(df), batch_size):
+            batch = df.iloc[start:start + batch_size]
+            fingerprints, occurrences = fingerprint_rows(batch, seen)
+            db.session.execute(db.update(Transaction), [
+                {'id': int(id), 'fingerprint': fingerprint, 'occurrence': int(occurrence)}
+                for id, fingerprint, occurrence in zip(batch['id'], fingerprints, occurrences)
+            ])
+            db.session.commit()
+            updated += len(batch)
+    
+    logging.info(f"Backfilled fingerprints for {updated} transactions")
+    click.echo(f'Fingerprinted {updated} transactions for {len(user_ids)} users.')
+
+@app.cli.command('rebuild-rollups')
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user.')
+@click.option('--if-empty', is_flag=True, help='Only build tables that are still empty, e.g. after upgrading.')
+def rebuild_rollups_command(user_id, if_empty):
+    """Recompute the monthly category rollup and weekly spending statistics from raw transactions."""
+    from rollups import rebuild_rollups, rebuild_if_empty
+    from spending_stats import rebuild_spending_stats, rebuild_if_empty as rebuild_stats_if_empty
+    
+    if if_empty:
+        # Run once per deploy rather than by every web worker at boot, where
+        # several could each rebuild while imports land in between
+        rows, categories = rebuild_if_empty(), rebuild_stats_if_empty()
+        if rows is None and categories is None:
+            click.echo('Rollups and spending statistics are already built.')
+            return
+        click.echo(f'Built {rows or 0} rollup rows and spending statistics for {categories or 0} categories.')
+        return
+    
+    rows = rebuild_rollups(user_id)
+    categories = rebuild_spending_stats(user_id)
+    click.echo(f'Rebuilt {rows} rollup rows and spending statistics for {categories} categories.')
+
+@app.cli.command('award-badges')
+@click.option('--user-id', type=int, default=None, help='Only check this user.')
+def award_badges_command(user_id):
+    """Check every badge condition, e.g. for users with data from before event-driven badges."""
+    from badges import check_and_award_badges
+    
+    user_ids = [user_id] if user_id else [row[0] for row in db.session.query(User.id)]
+    awarded = sum(len(check_and_award_badges(uid)) for uid in user_ids)
+    click.echo(f'Awarded {awarded} badges to {len(user_ids)} users.')
+
+@app.cli.command('refresh-insights')
+@click.option('--user-id', type=int, default=None, help='Only refresh this user.')
+def refresh_insights_command(user_id):
+    """Recompute stored insight snapshots, e.g. after changing how insights are generated."""
+    from snapshots import compute_snapshot
+    
+    user_ids = [user_id] if user_id else [row[0] for row in db.session.query(User.id)]
+    for uid in user_ids:
+        compute_snapshot(uid)
+    click.echo(f'Refreshed insights for {len(user_ids)} users.')
+
+@app.cli.command('forecast-spending')
+@click.option('--user-id', type=int, default=None, help='Only forecast this user.')
+@click.option('--batch-size', type=int, default=None, help='Users solved together.')
+def forecast_spending_command(user_id, batch_size):
+    """Forecast next month's spending per user and category."""
+    from forecasts import run_forecasts, BATCH_SIZE
+    
+    stored = run_forecasts(user_id, batch_size or BATCH_SIZE)
+    click.echo(f'Stored {stored} forecasts.')
+
+@app.cli.command('nightly-analytics')
+@click.option('--workers', type=int, default=None, help='Worker processes; 0 runs in this process.')
+@click.option('--chunk-size', type=int, default=None, help='Users per chunk.')
+@click.option('--restart', is_flag=True, help='Start over instead of resuming an interrupted run.')
+def nightly_analytics_command(workers, chunk_size, restart):
+    """Award badges and store insights, health scores and forecasts for every user."""
+    from analytics import run_analytics, CHUNK_SIZE
+    
+    def report(totals):
+        click.echo(f'{totals["users"]} users processed, {totals["failed"]} failed')
+    
+    totals = run_analytics(workers, chunk_size or CHUNK_SIZE, restart, progress=report)
+    if totals['resumed_after']:
+        click.echo(f'Resumed run {totals["run_id"]} after user {totals["resumed_after"]}.')
+    click.echo(f'Processed {totals["users"]} users in {totals["elapsed"]:.1f}s '
+               f'({totals["users_per_second"]:.1f} users/sec): {totals["failed"]} failed, '
+               f'{totals["badges"]} badges awarded, {totals["forecasts"]} forecasts stored.')
+
+@app.cli.command('db-upgrade')
+def db_upgrade():
+    """Create missing tables and apply pending schema migrations."""
+    from migrations import upgrade_database
+    
+    applied = upgrade_database()
+    click.echo(f'Applied {len(applied)} migrations: {", ".join(applied)}' if applied else 'Database is up to date.')
+
+def _hot_queries():
+    """Representative transaction queries and the index each one should use."""
+    from datetime import date
+    from sqlalchemy import or_
+    
+    return [
+        ('report date range', 'ix_transaction_user_date', Transaction.query.filter(
+            Transaction.user_id == 1,
+            Transaction.date >= date(2024, 1, 1),
+            Transaction.date <= date(2024, 12, 31)
+        ).order_by(Transaction.date.desc()).statement),
+        ('keyset page', 'ix_transaction_user_date', Transaction.query.filter(
+            Transaction.user_id == 1,
+            Transaction.date < date(2024, 6, 1)
+        ).order_by(Transaction.date.desc(), Transaction.id.desc()).limit(25).statement),
+        ('distinct categories', 'ix_transaction_user_category',
+         db.session.query(Transaction.category).filter_by(user_id=1).distinct().statement),
+        ('category filter', 'ix_transaction_user_category', Transaction.query.filter(
+            Transaction.user_id == 1,
+            Transaction.category == 'Utilities'
+        ).statement),
+        ('large amounts', 'ix_transaction_user_amount', Transaction.query.filter(
+            Transaction.user_id == 1,
+            or_(Transaction.amount >= 1000, Transaction.amount <= -1000)
+        ).statement),
+    ]
+
+def explain(statement):
+    """Return the query plan of a statement as text lines."""
+    dialect = db.engine.dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    
+    with db.engine.begin() as connection:
+        if dialect.name == 'sqlite':
+            return [row[-1] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}')]
+        if dialect.name == 'postgresql':
+            # Small tables are cheaper to scan; ask whether an index can serve the query at all
+            connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        return [row[0] for row in connection.exec_driver_sql(f'EXPLAIN {sql}')]
+
+@app.cli.command('check-query-plans')
+@click.option('--verbose', is_flag=True, help='Print the full plan of every query.')
+def check_query_plans(verbose):
+    """Fail if a hot transaction query stops using its index."""
+    failures = 0
+    for name, index, statement in _hot_queries():
+        plan = explain(statement)
+        used = any(index in line for line in plan)
+        failures += not used
+        click.echo(f'{"ok" if used else "MISSING":<8} {name:<20} {index}')
+        if verbose or not used:
+            for line in plan:
+                click.echo(f'         {line}')
+    
+    if failures:
+        raise click.ClickException(f'{failures} queries do not use their index.')
@@ -0,0 +1,114 @@
+import threading
+from collections import OrderedDict
+from datetime import date
+from app import app
+from models import Transaction, Goal, Badge, UserBadge
+from snapshots import get_insight_snapshot
+from rollups import get_totals, get_category_totals, get_monthly_totals
+from pagination import transaction_page
+
+# Latest dashboard context per user, least recently viewed first
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def get_monthly_series(user_id):
+    """Monthly income and expenses for the dashboard line chart"""
+    return {
+        year_month: {'income': totals['income'], 'expenses': totals['expenses']}
+        for year_month, totals in get_monthly_totals(user_id).items()
+    }
+
+def get_category_series(user_id):
+    """Spending per category for the dashboard doughnut chart"""
+    return {category: totals['total'] for category, totals in get_category_totals(user_id).items()}
+
+# Chart data served by /api/charts/<series>; charts are fetched after the page renders
+CHART_SERIES = {
+    'monthly': get_monthly_series,
+    'categories': get_category_series,
+}
+
+def build_dashboard_context(user_id, data_version):
+    """
+    Compute everything the dashboard page shows for a user, except chart series.
+    Also returns whether the stored insights it includes are up to date.
+    """
+    # Calculate basic statistics from the monthly rollup
+    total_income, total_expenses = get_totals(user_id)
+    net_worth = total_income - total_expenses
+
+    # Get recent transactions; older ones are loaded from the API as the table scrolls
+    recent_transactions, transactions_cursor = transaction_page(Transaction.query.filter_by(user_id=user_id), 10)
+
+    # Stored insights, recomputed in the background after writes
+    snapshot, insights_current = get_insight_snapshot(user_id, data_version)
+
+    # Get user's goals
+    goals = Goal.query.filter_by(user_id=user_id).all()
+
+    # Get user's badges
+    user_badges = UserBadge.query.filter_by(user_id=user_id).join(Badge).all()
+
+    # Cached values outlive the database session, so keep plain data rather than ORM objects
+    return {
+        'total_income': total_income,
+        'total_expenses': total_expenses,
+        'net_worth': net_worth,
+        'recent_transactions': [{
+            'id': t.id,
+            'date': t.date,
+            'amount': t.amount,
+            'description': t.description,
+            'category': t.category
+        } for t in recent_transactions],
+        'transactions_cursor': transactions_cursor,
+        'insights': snapshot.insights if snapshot else [],
+        'insights_pending': snapshot is None,
+        'health_score': snapshot.health_score if snapshot else None,
+        'goals': [{
+            'id': g.id,
+            'goal_name': g.goal_name,
+            'target_amount': g.target_amount,
+            'saved_amount': g.saved_amount,
+            'target_date': g.target_date,
+            'is_completed': g.is_completed,
+            'progress_percentage': g.progress_percentage
+        } for g in goals],
+        'user_badges': [{
+            'earned_at': ub.earned_at,
+            'badge': {
+                'name': ub.badge.name,
+                'description': ub.badge.description,
+                'icon': ub.badge.icon
+            }
+        } for ub in user_badges]
+    }, insights_current
+
+def get_dashboard_context(user_id, data_version):
+    """Get the dashboard context, recomputing it only when the user's data version changes"""
+    # Insights depend on the current day as well as on the data
+    version = (data_version or 0, date.today())
+
+    with _cache_lock:
+        cached = _cache.get(user_id)
+        if cached and cached[0] == version:
+            _cache.move_to_end(user_id)
+            return cached[1]
+
+    context, insights_current = build_dashboard_context(user_id, data_version)
+    if not insights_current:
+        # Serve stale insights this once, but rebuild when the fresh snapshot is stored
+        return context
+
+    with _cache_lock:
+        _cache[user_id] = (version, context)
+        _cache.move_to_end(user_id)
+        while len(_cache) > app.config['DASHBOARD_CACHE_SIZE']:
+            _cache.popitem(last=False)
+
+    return context
+
+def clear_dashboard_cache():
+    """Drop every cached dashboard context"""
+    with _cache_lock:
+        _cache.clear()
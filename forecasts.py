@@ -0,0 +1,163 @@
+"""
+Batch spending forecasts.
+
+Fits the same trend as insights.predict_spending -- a least-squares line
+through a series' monthly spending, indexed by the months that have
+transactions -- for every user and category at once. Monthly sums come
+from the rollup, are laid out as a (user x category x month) tensor, and
+all the lines are solved together in closed form.
+"""
+import logging
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert, select
+from app import db
+from models import User, MonthlyRollup, SpendingForecast
+
+# Users forecast together; bounds the tensor to about users x categories x months floats
+BATCH_SIZE = 500
+
+# Same thresholds as predict_spending
+MIN_TRANSACTIONS = 6
+MIN_MONTHS = 3
+
+def _month_index(year_month: pd.Series) -> np.ndarray:
+    parts = year_month.str.split('-', expand=True).astype(int)
+    return (parts[0] * 12 + parts[1] - 1).to_numpy()
+
+def _month_key(index: int) -> str:
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+def build_spending_tensor(user_ids: List[int]) -> Tuple[np.ndarray, np.ndarray, List[int], List[Optional[str]], int]:
+    """
+    Lay out monthly spending of a batch of users as dense arrays.
+
+    Args:
+        user_ids: Users to include
+
+    Returns:
+        Tuple of the spending and transaction count tensors, both shaped
+        (user, category, month), the users and categories along the first
+        two axes, and the month index of the first month. Category None
+        holds the totals over all categories.
+    """
+    query = select(
+        MonthlyRollup.user_id, MonthlyRollup.year_month, MonthlyRollup.category,
+        MonthlyRollup.expenses, MonthlyRollup.count
+    ).where(MonthlyRollup.user_id.in_(user_ids))
+    rows = pd.read_sql(query, db.session.connection())
+
+    users = sorted(rows['user_id'].unique().tolist())
+    categories = [None] + sorted(rows['category'].unique().tolist())
+    if rows.empty:
+        return np.zeros((0, 1, 0)), np.zeros((0, 1, 0), dtype=np.int64), users, categories, 0
+
+    months = _month_index(rows['year_month'])
+    first_month = int(months.min())
+    shape = (len(users), len(categories), int(months.max()) - first_month + 1)
+
+    user_index = np.searchsorted(users, rows['user_id'].to_numpy())
+    category_index = np.searchsorted(categories[1:], rows['category'].to_numpy()) + 1
+    month_index = months - first_month
+
+    spending = np.zeros(shape)
+    counts = np.zeros(shape, dtype=np.int64)
+    for index in (category_index, np.zeros_like(category_index)):
+        np.add.at(spending, (user_index, index, month_index), rows['expenses'].to_numpy())
+        np.add.at(counts, (user_index, index, month_index), rows['count'].to_numpy())
+
+    return spending, counts, users, categories, first_month
+
+def fit_trends(spending: np.ndarray, observed: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Solve least-squares lines through every series along the last axis.
+
+    Points are the observed months only, numbered 0, 1, 2, ... in order,
+    so gaps without transactions do not stretch the trend.
+
+    Args:
+        spending: Monthly spending, any leading shape
+        observed: Boolean mask of months with transactions, same shape
+
+    Returns:
+        Tuple of the next point of each line (clipped at zero) and the
+        number of points it was fitted to
+    """
+    weights = observed.astype(float)
+    x = (np.cumsum(observed, axis=-1) - 1) * weights
+    y = spending * weights
+
+    n = weights.sum(axis=-1)
+    sum_x = x.sum(axis=-1)
+    sum_y = y.sum(axis=-1)
+    sum_xx = (x * x).sum(axis=-1)
+    sum_xy = (x * y).sum(axis=-1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denominator = n * sum_xx - sum_x ** 2
+        slope = np.where(denominator > 0, (n * sum_xy - sum_x * sum_y) / denominator, 0.0)
+        intercept = np.where(n > 0, (sum_y - slope * sum_x) / n, 0.0)
+
+    return np.maximum(intercept + slope * n, 0.0), n.astype(int)
+
+def forecast_users(user_ids: List[int]) -> int:
+    """
+    Forecast next month's spending for a batch of users and store it,
+    replacing their previous forecasts.
+
+    Returns:
+        Number of forecasts stored
+    """
+    spending, counts, users, categories, first_month = build_spending_tensor(user_ids)
+    records = []
+
+    if users:
+        observed = counts > 0
+        forecast, months_used = fit_trends(spending, observed)
+
+        # The month after each series' last month with transactions
+        last_month = observed.shape[-1] - 1 - np.argmax(observed[..., ::-1], axis=-1)
+
+        eligible = (months_used >= MIN_MONTHS) & (counts[:, :1, :].sum(axis=-1) >= MIN_TRANSACTIONS)
+        computed_at = datetime.utcnow()
+        records = [{
+            'user_id': users[u],
+            'category': categories[c],
+            'year_month': _month_key(first_month + int(last_month[u, c]) + 1),
+            'amount': float(forecast[u, c]),
+            'months_used': int(months_used[u, c]),
+            'computed_at': computed_at
+        } for u, c in zip(*np.nonzero(eligible))]
+
+    try:
+        SpendingForecast.query.filter(SpendingForecast.user_id.in_(user_ids)).delete(synchronize_session=False)
+        if records:
+            db.session.execute(insert(SpendingForecast.__table__), records)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return len(records)
+
+def run_forecasts(user_id: Optional[int] = None, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Forecast every user's spending, a batch of users at a time.
+
+    Args:
+        user_id: Forecast only this user, or every user when None
+        batch_size: Users per tensor
+
+    Returns:
+        Number of forecasts stored
+    """
+    user_ids = [user_id] if user_id else [row[0] for row in db.session.query(User.id).order_by(User.id)]
+    stored = 0
+    for start in range(0, len(user_ids), batch_size):
+        stored += forecast_users(user_ids[start:start + batch_size])
+
+    logging.info(f"Stored {stored} spending forecasts for {len(user_ids)} users")
+    return stored
@@ -0,0 +1,382 @@
+import io
+import os
+import zipfile
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import insert
+from app import app, db
+from models import Transaction, bump_data_version
+from categorizer import categorize_many
+from statement_parser import (missing_columns, guess_date_format, clean_transactions, file_format,
+                              columnar_available, record_batches, parse_member)
+from rollups import apply_transactions
+from spending_stats import update_spending_stats, check_spending_alerts
+
+# Rows written per INSERT batch / COPY and committed together
+CHUNK_SIZE = 5000
+
+# Transaction columns the monthly rollup is computed from
+ROLLUP_COLUMNS = ['user_id', 'date', 'amount', 'category']
+
+# Row error messages kept per import; further errors are only counted
+MAX_REPORTED_ERRORS = 1000
+
+def prepare_transactions(df: pd.DataFrame, user_id: int, start_row: int = 0,
+                         date_format: Optional[str] = None,
+                         seen: Optional[Dict[str, int]] = None) -> Tuple[pd.DataFrame, List[str]]:
+    """
+    Validate and categorize a frame of raw transactions.
+
+    Args:
+        df: Frame with date, amount and description columns
+        user_id: Owner of the transactions
+        start_row: Offset added to row numbers in error messages
+        date_format: Date format to use instead of guessing one
+        seen: Fingerprint occurrences from earlier chunks of the same file
+
+    Returns:
+        Tuple of a frame of valid rows ready for insertion and a list of
+        (row number, message) errors
+    """
+    rows, errors = clean_transactions(df, user_id, start_row, date_format, seen)
+    rows.insert(rows.columns.get_loc('description') + 1, 'category',
+                categorize_many(rows['description'], user_id=user_id))
+    return rows, errors
+
+def format_row_error(row_number: int, message: str) -> str:
+    """Format a row error for display."""
+    return f"Row {row_number}: {message}"
+
+def _records(rows: pd.DataFrame, created_at: datetime) -> List[dict]:
+    """Convert a frame to executemany parameters column-wise."""
+    columns = list(rows.columns) + ['created_at']
+    values = [rows[column].tolist() for column in rows.columns] + [[created_at] * len(rows)]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+def _use_copy() -> bool:
+    dialect = db.engine.dialect
+    return dialect.name == 'postgresql' and dialect.driver == 'psycopg2'
+
+def _insert_statement():
+    """INSERT that skips rows whose fingerprint and occurrence already exist."""
+    table = Transaction.__table__
+    dialect = db.engine.dialect.name
+
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return insert(table)
+
+    # Inserted rows are returned so only they are added to the rollup
+    return dialect_insert(table).on_conflict_do_nothing(
+        index_elements=['fingerprint', 'occurrence']
+    ).returning(*[table.c[column] for column in ROLLUP_COLUMNS])
+
+def _copy_rows(rows: pd.DataFrame, created_at: datetime) -> pd.DataFrame:
+    """
+    Load rows with PostgreSQL COPY through a temporary table.
+
+    Returns:
+        Frame of the rows inserted after skipping duplicates
+    """
+    rows = rows.assign(created_at=created_at)
+    buffer = io.StringIO()
+    rows.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+
+    columns = ', '.join(rows.columns)
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.execute(f'CREATE TEMP TABLE transaction_import ON COMMIT DROP AS '
+                       f'SELECT {columns} FROM "transaction" WITH NO DATA')
+        cursor.copy_expert(f'COPY transaction_import ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+        cursor.execute(f'INSERT INTO "transaction" ({columns}) SELECT {columns} FROM transaction_import '
+                       f'ON CONFLICT (fingerprint, occurrence) DO NOTHING RETURNING {", ".join(ROLLUP_COLUMNS)}')
+        return pd.DataFrame(cursor.fetchall(), columns=ROLLUP_COLUMNS)
+    finally:
+        cursor.close()
+
+def bulk_insert_transactions(rows: pd.DataFrame, chunk_size: Optional[int] = None) -> int:
+    """
+    Write prepared rows in chunks, committing after each chunk.
+
+    Uses COPY on PostgreSQL and executemany INSERTs elsewhere, so no ORM
+    objects are built and no transaction is held open for the whole file.
+    Rows that were already imported are skipped by the unique fingerprint
+    index rather than by comparing against existing transactions. The
+    monthly rollup and weekly spending statistics are updated, and alerts
+    for unusual spending raised, in the same database transaction.
+
+    Returns:
+        Number of rows inserted
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    use_copy = _use_copy()
+    statement = _insert_statement()
+    inserted = 0
+
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows.iloc[start:start + chunk_size]
+        if chunk.empty:
+            continue
+        created_at = datetime.utcnow()
+        try:
+            if use_copy:
+                added = _copy_rows(chunk, created_at)
+            else:
+                result = db.session.execute(statement, _records(chunk, created_at))
+                if result.returns_rows:
+                    added = pd.DataFrame(result.all(), columns=ROLLUP_COLUMNS)
+                else:
+                    added = chunk[ROLLUP_COLUMNS]
+            apply_transactions(added)
+            check_spending_alerts(update_spending_stats(added))
+            for user_id in added['user_id'].unique():
+                bump_data_version(int(user_id))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        inserted += len(added)
+
+    return inserted
+
+def import_dataframe(df: pd.DataFrame, user_id: int) -> Tuple[int, int, List[str]]:
+    """
+    Import a frame of raw transactions for a user.
+
+    Returns:
+        Tuple of the number of transactions added, duplicates skipped and
+        per-row error messages
+    """
+    rows, row_errors = prepare_transactions(df, user_id)
+    errors = [format_row_error(row, message) for row, message in row_errors]
+    added = bulk_insert_transactions(rows)
+    logging.info(f"Imported {added} transactions for user {user_id} with {len(errors)} errors")
+    return added, len(rows) - added, errors
+
+def _import_chunks(chunks: Iterable[pd.DataFrame], user_id: int, chunk_size: int,
+                   progress: Optional[Callable[[int, int, List[Tuple[int, str]]], None]] = None
+                   ) -> Tuple[int, int, int, List[str]]:
+    """Validate, categorize and insert frames one at a time."""
+    added = 0
+    duplicates = 0
+    failed = 0
+    errors = []
+    date_format = None
+    start_row = 0
+    # One count per distinct fingerprint for the whole file; dropping counts
+    # early would restart the numbering of repeats in files that go back in date
+    seen = {}
+
+    for chunk in chunks:
+        if start_row == 0:
+            missing = missing_columns(chunk)
+            if missing:
+                raise ValueError(f'File must contain columns: {", ".join(missing)}')
+            date_format = guess_date_format(chunk['date'])
+
+        rows, chunk_errors = prepare_transactions(chunk, user_id, start_row, date_format, seen)
+        chunk_added = bulk_insert_transactions(rows, chunk_size)
+        chunk_duplicates = len(rows) - chunk_added
+        added += chunk_added
+        duplicates += chunk_duplicates
+        failed += len(chunk_errors)
+        errors.extend(format_row_error(row, message)
+                      for row, message in chunk_errors[:MAX_REPORTED_ERRORS - len(errors)])
+        start_row += len(chunk)
+
+        if progress:
+            progress(chunk_added, chunk_duplicates, chunk_errors)
+
+    return added, duplicates, failed, errors
+
+def import_csv_stream(stream, user_id: int, chunk_size: Optional[int] = None,
+                      progress: Optional[Callable[[int, int, List[Tuple[int, str]]], None]] = None
+                      ) -> Tuple[int, int, int, List[str]]:
+    """
+    Import a CSV file from a stream, one bounded chunk at a time.
+
+    Each chunk is parsed, categorized and committed before the next one is
+    read, so only one chunk of rows is held in memory, plus one occurrence
+    count per distinct transaction, and this function never writes the
+    file to disk. Uploads queued by jobs.enqueue_import are spooled before
+    they reach it.
+
+    Args:
+        stream: Binary or text file-like object with CSV content
+        user_id: Owner of the transactions
+        chunk_size: Rows read, categorized and committed together
+        progress: Called after each committed chunk with the rows added,
+            duplicates skipped and (row number, message) errors of that chunk
+
+    Returns:
+        Tuple of rows added, duplicates skipped, rows failed and up to
+        MAX_REPORTED_ERRORS per-row error messages
+
+    Raises:
+        ValueError: If the CSV is empty or lacks a required column
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+
+    try:
+        reader = pd.read_csv(stream, chunksize=chunk_size)
+    except pd.errors.EmptyDataError:
+        raise ValueError('The uploaded CSV file is empty.')
+
+    with reader:
+        added, duplicates, failed, errors = _import_chunks(reader, user_id, chunk_size, progress)
+
+    logging.info(f"Streamed {added} transactions for user {user_id} "
+                 f"with {duplicates} duplicates and {failed} errors")
+    return added, duplicates, failed, errors
+
+def import_columnar_stream(stream, user_id: int, file_format: str, chunk_size: Optional[int] = None,
+                           progress: Optional[Callable[[int, int, List[Tuple[int, str]]], None]] = None
+                           ) -> Tuple[int, int, int, List[str]]:
+    """
+    Import a Parquet or Arrow IPC file one record batch at a time.
+
+    Columns are converted straight from Arrow buffers, so typed date and
+    amount columns skip text parsing entirely.
+
+    Args:
+        stream: Seekable binary file-like object
+        user_id: Owner of the transactions
+        file_format: 'parquet' or 'arrow'
+        chunk_size: Rows converted, categorized and committed together
+        progress: Called after each committed chunk, as for import_csv_stream
+
+    Returns:
+        Tuple of rows added, duplicates skipped, rows failed and up to
+        MAX_REPORTED_ERRORS per-row error messages
+
+    Raises:
+        ValueError: If pyarrow is not installed, or the file is unreadable or
+        lacks a required column
+    """
+    if not columnar_available():
+        raise ValueError('Parquet and Arrow files require pyarrow to be installed.')
+
+    import pyarrow as pa
+
+    chunk_size = chunk_size or CHUNK_SIZE
+
+    try:
+        added, duplicates, failed, errors = _import_chunks(
+            record_batches(stream, file_format, chunk_size), user_id, chunk_size, progress
+        )
+    except pa.ArrowException as e:
+        raise ValueError(f'The uploaded file is not a valid {file_format.title()} file: {e}')
+
+    logging.info(f"Imported {added} transactions from {file_format} for user {user_id} "
+                 f"with {duplicates} duplicates and {failed} errors")
+    return added, duplicates, failed, errors
+
+def archive_members(archive: zipfile.ZipFile) -> List[str]:
+    """List the importable files in an archive, skipping folders and OS metadata."""
+    members = []
+    for info in archive.infolist():
+        basename = os.path.basename(info.filename)
+        if info.is_dir() or info.filename.startswith('__MACOSX/') or basename.startswith('.'):
+            continue
+        member_format = file_format(basename)
+        if member_format and member_format != 'zip':
+            members.append(info.filename)
+    return sorted(members)
+
+def import_zip_archive(stream, user_id: int, workers: Optional[int] = None,
+                       progress: Optional[Callable[[int, int, List[Tuple[int, str]]], None]] = None
+                       ) -> Tuple[int, int, int, List[str]]:
+    """
+    Import a zip of statement files in parallel.
+
+    Members are parsed across a process pool, merged in name order with
+    transactions repeated across overlapping statements removed,
+    categorized together and written in a single bulk insert.
+
+    Args:
+        stream: Seekable binary file-like object with zip content
+        user_id: Owner of the transactions
+        workers: Worker processes, defaults to IMPORT_PROCESSES
+        progress: Called as members are parsed with their errors, then once
+            with the rows added and duplicates skipped by the write
+
+    Returns:
+        Tuple of rows added, duplicates skipped, rows failed and up to
+        MAX_REPORTED_ERRORS per-row error messages
+
+    Raises:
+        ValueError: If the archive is invalid or has no importable files
+    """
+    workers = workers or app.config['IMPORT_PROCESSES']
+
+    try:
+        archive = zipfile.ZipFile(stream)
+    except zipfile.BadZipFile:
+        raise ValueError('The uploaded file is not a valid zip archive.')
+
+    with archive:
+        members = archive_members(archive)
+        if not members:
+            raise ValueError('The zip archive contains no CSV, Parquet or Arrow files.')
+        if len(members) > app.config['MAX_ARCHIVE_MEMBERS']:
+            raise ValueError(f'The zip archive contains more than {app.config["MAX_ARCHIVE_MEMBERS"]} files.')
+
+        # Sizes come from the archive directory and reads stop at them, so
+        # limits are checked before anything is decompressed
+        member_limit = app.config['MAX_ARCHIVE_MEMBER_SIZE']
+        oversized = [name for name in members if archive.getinfo(name).file_size > member_limit]
+        members = [name for name in members if name not in oversized]
+        if sum(archive.getinfo(name).file_size for name in members) > app.config['MAX_ARCHIVE_SIZE']:
+            raise ValueError(f'The zip archive is larger than {app.config["MAX_ARCHIVE_SIZE"] // (1024 * 1024)}MB '
+                             f'uncompressed.')
+
+        frames = []
+        failed = len(oversized)
+        errors = [f'{name}: File is larger than {member_limit // (1024 * 1024)}MB uncompressed.'
+                  for name in oversized][:MAX_REPORTED_ERRORS]
+        if progress and oversized:
+            progress(0, 0, [(0, error) for error in errors])
+        window = max(1, workers) * 2
+        # Workers come from a fork server rather than forking this process,
+        # whose other threads may hold locks a forked child would inherit. They
+        # only run the app-free statement parser; categorizing needs the
+        # user's rules from the database, so it happens here on the merged rows
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(members))),
+                                 mp_context=multiprocessing.get_context('forkserver')) as pool:
+            # Submit a bounded window so only a few members are held in memory at once
+            for start in range(0, len(members), window):
+                futures = [pool.submit(parse_member, name, archive.read(name), user_id)
+                           for name in members[start:start + window]]
+                for future in futures:
+                    rows, member_errors = future.result()
+                    if rows is not None:
+                        frames.append(rows)
+                    failed += len(member_errors)
+                    errors.extend(format_row_error(row, message) if row else message
+                                  for row, message in member_errors[:MAX_REPORTED_ERRORS - len(errors)])
+                    if progress:
+                        progress(0, 0, member_errors)
+
+    rows = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    merged = rows.drop_duplicates(['fingerprint', 'occurrence']) if not rows.empty else rows
+    if not merged.empty:
+        merged = merged.copy()
+        merged.insert(merged.columns.get_loc('description') + 1, 'category',
+                      categorize_many(merged['description'], user_id=user_id))
+    added = bulk_insert_transactions(merged)
+    duplicates = len(rows) - added
+    if progress:
+        progress(added, duplicates, [])
+
+    logging.info(f"Imported {added} transactions from {len(members)} archive files for user {user_id} "
+                 f"with {duplicates} duplicates and {failed} errors")
+    return added, duplicates, failed, errors
@@ -1,28 +1,37 @@
 import pandas as pd
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from flask import g, has_request_context
+from sqlalchemy import func, select
 from models import Transaction, Goal, Debt
 from app import db
+from rollups import get_monthly_totals, get_category_totals
+from spending_stats import unusual_spending, week_start
 import logging
 
-def generate_insights(user_id):
+def load_transactions(user_id):
+    """Load a user's transactions as a typed DataFrame of date, amount and category"""
+    # Within a request every insight shares one load
+    cache = g.setdefault('transaction_frames', {}) if has_request_context() else {}
+    if user_id not in cache:
+        query = select(Transaction.date, Transaction.amount, Transaction.category).where(
+            Transaction.user_id == user_id
+        )
+        df = pd.read_sql(query, db.session.connection(), dtype={'amount': 'float64', 'category': 'object'})
+        df['date'] = pd.to_datetime(df['date'])
+        cache[user_id] = df
+    return cache[user_id]
+
+def generate_insights(user_id, df=None):
     """Generate financial insights for a user"""
     insights = []
     
     # Get user's transactions
-    transactions = Transaction.query.filter_by(user_id=user_id).all()
+    if df is None:
+        df = load_transactions(user_id)
     
-    if not transactions:
+    if df.empty:
         return ["Upload some transactions to get personalized insights!"]
     
-    # Convert to DataFrame for analysis
-    df = pd.DataFrame([{
-        'date': t.date,
-        'amount': t.amount,
-        'category': t.category,
-        'description': t.description
-    } for t in transactions])
-    
     # Monthly spending analysis
     current_month = datetime.now().month
     current_year = datetime.now().year
@@ -58,18 +67,10 @@ def generate_insights(user_id):
             
             insights.append(f"💰 Your highest spending category is '{top_category}' with ${top_amount:.2f}")
             
-            # Check for unusual spending patterns
-            category_avg = expense_df.groupby('category')['amount'].mean().abs()
-            recent_transactions = expense_df[expense_df['date'] >= datetime.now().date() - timedelta(days=7)]
-            
-            if not recent_transactions.empty:
-                recent_category_spending = recent_transactions.groupby('category')['amount'].sum().abs()
-                for category in recent_category_spending.index:
-                    if category in category_avg.index:
-                        recent_amount = recent_category_spending[category]
-                        avg_amount = category_avg[category] * 7  # Weekly average
-                        if recent_amount > avg_amount * 1.5:
-                            insights.append(f"📈 You spent 50% more than usual on '{category}' this week!")
+            # Check for unusual spending this week against the running weekly statistics
+            for unusual in unusual_spending(user_id, week_start(datetime.now().date())):
+                increase = (unusual['total'] / unusual['usual'] - 1) * 100
+                insights.append(f"📈 You spent {increase:.0f}% more than usual on '{unusual['category']}' this week!")
     
     # Income insights
     income_df = df[df['amount'] > 0]
@@ -103,8 +104,8 @@ def generate_insights(user_id):
             insights.append(f"💳 Focus on paying off '{highest_interest_debt.debt_name}' first - it has the highest interest rate ({highest_interest_debt.interest_rate:.1f}%)")
     
     # Transaction frequency insights
-    if len(transactions) > 30:
-        avg_transactions_per_day = len(transactions) / (df['date'].max() - df['date'].min()).days
+    if len(df) > 30:
+        avg_transactions_per_day = len(df) / max((df['date'].max() - df['date'].min()).days, 1)
         if avg_transactions_per_day > 3:
             insights.append(f"📊 You make an average of {avg_transactions_per_day:.1f} transactions per day")
     
@@ -119,24 +120,24 @@ def generate_insights(user_id):
     
     return insights[:8] if insights else ["Keep tracking your expenses to get personalized insights!"]
 
-def predict_spending(user_id, category=None):
+def predict_spending(user_id, category=None, df=None):
     """Predict next month's spending using simple linear regression"""
     try:
         from sklearn.linear_model import LinearRegression
         import numpy as np
         
         # Get historical data
-        transactions = Transaction.query.filter_by(user_id=user_id).all()
+        transactions = df if df is not None else load_transactions(user_id)
         
         if len(transactions) < 6:
             return None
         
         # Create monthly spending data
-        df = pd.DataFrame([{
-            'date': t.date,
-            'amount': abs(t.amount) if t.amount < 0 else 0,
-            'category': t.category
-        } for t in transactions])
+        df = pd.DataFrame({
+            'date': transactions['date'],
+            'amount': (-transactions['amount']).clip(lower=0),
+            'category': transactions['category']
+        })
         
         # Filter by category if specified
         if category:
@@ -168,70 +169,54 @@ def predict_spending(user_id, category=None):
 
 def get_spending_trends(user_id):
     """Get spending trends over time"""
-    transactions = Transaction.query.filter_by(user_id=user_id).all()
+    monthly_totals = get_monthly_totals(user_id)
     
-    if not transactions:
+    if not monthly_totals:
         return {}
     
-    df = pd.DataFrame([{
-        'date': t.date,
-        'amount': t.amount,
-        'category': t.category
-    } for t in transactions])
-    
     # Monthly trends
-    df['month'] = df['date'].dt.to_period('M')
-    monthly_data = df.groupby('month').agg({
-        'amount': lambda x: {
-            'income': x[x > 0].sum(),
-            'expenses': abs(x[x < 0].sum())
+    return {
+        'amount': {
+            pd.Period(year_month, freq='M'): {
+                'income': totals['income'],
+                'expenses': totals['expenses']
+            }
+            for year_month, totals in monthly_totals.items()
         }
-    })
-    
-    return monthly_data.to_dict()
+    }
 
 def get_category_insights(user_id):
     """Get detailed category-wise insights"""
-    transactions = Transaction.query.filter_by(user_id=user_id).all()
+    category_totals = get_category_totals(user_id)
     
-    if not transactions:
+    if not category_totals:
         return {}
     
-    expense_transactions = [t for t in transactions if t.amount < 0]
     category_data = {}
-    
-    for transaction in expense_transactions:
-        category = transaction.category
-        if category not in category_data:
-            category_data[category] = {
-                'total': 0,
-                'count': 0,
-                'average': 0
-            }
-        
-        category_data[category]['total'] += abs(transaction.amount)
-        category_data[category]['count'] += 1
-    
-    # Calculate averages
-    for category in category_data:
-        category_data[category]['average'] = category_data[category]['total'] / category_data[category]['count']
+    for category, totals in category_totals.items():
+        category_data[category] = {
+            'total': totals['total'],
+            'count': totals['count'],
+            'average': totals['total'] / totals['count']
+        }
     
     return category_data
 
-def get_financial_health_score(user_id):
+def get_financial_health_score(user_id, df=None):
     """Calculate a financial health score out of 100"""
     try:
-        transactions = Transaction.query.filter_by(user_id=user_id).all()
+        transactions = df if df is not None else load_transactions(user_id)
         
-        if not transactions:
+        if transactions.empty:
             return 0
         
         score = 0
         max_score = 100
         
         # Calculate income vs expenses ratio (30 points)
-        total_income = sum(t.amount for t in transactions if t.amount > 0)
-        total_expenses = sum(abs(t.amount) for t in transactions if t.amount < 0)
+        amounts = transactions['amount']
+        total_income = amounts[amounts > 0].sum()
+        total_expenses = -amounts[amounts < 0].sum()
         
         if total_income > 0:
             savings_rate = (total_income - total_expenses) / total_income
@@ -266,7 +251,7 @@ def get_financial_health_score(user_id):
         
         # Consistency (20 points)
         if len(transactions) > 30:
-            recent_transactions = [t for t in transactions if t.date >= datetime.now().date() - timedelta(days=30)]
+            recent_transactions = transactions[transactions['date'] >= pd.Timestamp(datetime.now().date() - timedelta(days=30))]
             if len(recent_transactions) >= 10:
                 score += 20
             elif len(recent_transactions) >= 5:
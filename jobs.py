@@ -0,0 +1,136 @@
+import shutil
+import tempfile
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from app import app, db
+from models import ImportJob, ImportJobError, SpendingAlert
+from importer import import_csv_stream, import_columnar_stream, import_zip_archive, MAX_REPORTED_ERRORS
+from badges import check_and_award_badges, TRANSACTIONS_ADDED
+from snapshots import schedule_refresh
+
+# Bytes copied at a time when spooling an upload
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Reported for jobs whose worker stopped making progress, e.g. after a crash or restart
+STALLED_ERROR = 'Import stopped responding. Please upload the file again.'
+
+# Local worker pool; job state lives in the database so any worker can report it
+_executor = ThreadPoolExecutor(max_workers=app.config['IMPORT_WORKERS'], thread_name_prefix='import')
+
+def enqueue_import(stream, user_id, filename=None, file_format='csv'):
+    """Spool an uploaded CSV, Parquet, Arrow or zip file and queue it for import in the background"""
+    # The request stream is gone once the response is sent, so the whole body
+    # is read before the import starts: in memory up to IMPORT_SPOOL_SIZE and
+    # in an anonymous temp file, deleted on close, beyond. Reading stays in
+    # bounded chunks and each chunk is still committed as it is imported.
+    spool = tempfile.SpooledTemporaryFile(max_size=app.config['IMPORT_SPOOL_SIZE'])
+    shutil.copyfileobj(stream, spool, COPY_BUFFER_SIZE)
+    spool.seek(0)
+
+    job = ImportJob(user_id=user_id, filename=filename, status='queued')
+    db.session.add(job)
+    db.session.commit()
+
+    _executor.submit(_run_import, job.id, spool, file_format)
+    return job
+
+def _run_import(job_id, spool, file_format):
+    """Run a queued import, recording progress and row errors on the job"""
+    with app.app_context():
+        job = db.session.get(ImportJob, job_id)
+        job.status = 'running'
+        job.started_at = datetime.utcnow()
+        db.session.commit()
+
+        def record_progress(chunk_added, chunk_duplicates, chunk_errors):
+            stored = job.rows_failed
+            job.rows_added += chunk_added
+            job.rows_duplicate += chunk_duplicates
+            job.rows_failed += len(chunk_errors)
+            # Chunks without any rows still show the worker is alive
+            job.updated_at = datetime.utcnow()
+            for row_number, message in chunk_errors[:max(0, MAX_REPORTED_ERRORS - stored)]:
+                db.session.add(ImportJobError(job_id=job.id, row_number=row_number, message=message[:500]))
+            db.session.commit()
+
+        try:
+            if file_format == 'csv':
+                import_csv_stream(spool, job.user_id, progress=record_progress)
+            elif file_format == 'zip':
+                import_zip_archive(spool, job.user_id, progress=record_progress)
+            else:
+                import_columnar_stream(spool, job.user_id, file_format, progress=record_progress)
+            job.status = 'completed'
+
+            if job.rows_added > 0:
+                # Check for new badges
+                check_and_award_badges(job.user_id, TRANSACTIONS_ADDED)
+                
+                # Have insights ready before the user opens the dashboard
+                schedule_refresh(job.user_id)
+
+        except ValueError as e:
+            db.session.rollback()
+            job.status = 'failed'
+            job.error = str(e)
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Import job {job_id} error: {e}")
+            job.status = 'failed'
+            job.error = f'Error processing file: {str(e)}'[:500]
+        finally:
+            spool.close()
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            logging.info(f"Import job {job_id} {job.status}: {job.rows_added} added, "
+                         f"{job.rows_duplicate} duplicates, {job.rows_failed} failed")
+
+def _stall_timeout():
+    return timedelta(seconds=app.config['IMPORT_JOB_TIMEOUT'])
+
+def fail_stalled_jobs():
+    """Mark queued or running jobs that stopped making progress as failed, so pages stop waiting on them"""
+    cutoff = datetime.utcnow() - _stall_timeout()
+    stalled = ImportJob.query.filter(db.or_(
+        db.and_(ImportJob.status == 'queued', ImportJob.created_at < cutoff),
+        db.and_(ImportJob.status == 'running',
+                db.func.coalesce(ImportJob.updated_at, ImportJob.started_at) < cutoff)
+    )).all()
+    for job in stalled:
+        job.status = 'failed'
+        job.error = STALLED_ERROR
+        job.finished_at = datetime.utcnow()
+    db.session.commit()
+    
+    if stalled:
+        logging.info(f"Failed {len(stalled)} stalled import jobs")
+    return len(stalled)
+
+def job_status(job):
+    """Summarize an import job for the status endpoint"""
+    # Reported as failed without writing; fail_stalled_jobs records it at the next startup
+    stalled = job.is_stalled(_stall_timeout())
+    return {
+        'id': job.id,
+        'filename': job.filename,
+        'status': 'failed' if stalled else job.status,
+        'finished': job.is_finished or stalled,
+        'rows_processed': job.rows_processed,
+        'rows_added': job.rows_added,
+        'rows_failed': job.rows_failed,
+        'rows_duplicate': job.rows_duplicate,
+        'throughput': round(job.throughput, 1),
+        'error': STALLED_ERROR if stalled else job.error,
+        'errors': [
+            {'row': error.row_number, 'message': error.message}
+            for error in job.errors.limit(MAX_REPORTED_ERRORS)
+        ],
+        'alerts': [
+            {'category': alert.category, 'total': round(alert.total, 2), 'usual': round(alert.usual, 2)}
+            for alert in SpendingAlert.query.filter(
+                SpendingAlert.user_id == job.user_id,
+                SpendingAlert.created_at >= job.started_at
+            ).order_by(SpendingAlert.id)
+        ] if job.started_at else []
+    }
@@ -0,0 +1,113 @@
+"""
+Versioned schema migrations.
+
+db.create_all() creates missing tables but never alters existing ones, so
+every change to a table that already shipped is a migration here. They
+run in order at startup (or with `flask db-upgrade`), one process at a
+time, and are recorded in the schema_migration table. Migrations are written to be no-ops on a
+database that create_all() has just built with the current models.
+"""
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List
+
+from app import db
+from models import SchemaMigration
+
+# Key of the PostgreSQL advisory lock held while the schema is upgraded
+UPGRADE_LOCK_KEY = 720_001
+
+def _add_column(connection, table: str, column: str, definition: str) -> None:
+    existing = {c['name'] for c in db.inspect(connection).get_columns(table)}
+    if column not in existing:
+        connection.exec_driver_sql(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {definition}')
+
+def _create_index(connection, name: str, table: str, columns: List[str], unique: bool = False) -> None:
+    column_list = ', '.join(f'"{column}"' for column in columns)
+    connection.exec_driver_sql(
+        f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS {name} ON "{table}" ({column_list})'
+    )
+
+def _transaction_fingerprint(connection):
+    _add_column(connection, 'transaction', 'fingerprint', 'VARCHAR(32)')
+    _add_column(connection, 'transaction', 'occurrence', 'INTEGER DEFAULT 1')
+    _create_index(connection, 'ix_transaction_fingerprint', 'transaction', ['fingerprint', 'occurrence'], unique=True)
+
+def _import_job_duplicates(connection):
+    _add_column(connection, 'import_job', 'rows_duplicate', 'INTEGER DEFAULT 0')
+
+def _user_data_version(connection):
+    _add_column(connection, 'user', 'data_version', 'INTEGER DEFAULT 0')
+
+def _transaction_query_indexes(connection):
+    # Every transaction query filters by user, then by date range, category or amount
+    _create_index(connection, 'ix_transaction_user_date', 'transaction', ['user_id', 'date'])
+    _create_index(connection, 'ix_transaction_user_category', 'transaction', ['user_id', 'category'])
+    _create_index(connection, 'ix_transaction_user_amount', 'transaction', ['user_id', 'amount'])
+
+def _import_job_heartbeat(connection):
+    _add_column(connection, 'import_job', 'updated_at', 'TIMESTAMP')
+
+# Applied in order; never rename or reorder a migration once it has shipped
+MIGRATIONS = [
+    ('0001_transaction_fingerprint', _transaction_fingerprint),
+    ('0002_import_job_duplicates', _import_job_duplicates),
+    ('0003_user_data_version', _user_data_version),
+    ('0004_transaction_query_indexes', _transaction_query_indexes),
+    ('0005_import_job_heartbeat', _import_job_heartbeat),
+]
+
+def pending_migrations() -> List[str]:
+    """Return the versions of migrations that have not been applied."""
+    applied = {row.version for row in SchemaMigration.query.all()}
+    return [version for version, _ in MIGRATIONS if version not in applied]
+
+def run_migrations() -> List[str]:
+    """
+    Apply pending migrations, each in its own transaction.
+
+    Returns:
+        Versions that were applied
+    """
+    pending = set(pending_migrations())
+    applied = []
+
+    for version, migrate in MIGRATIONS:
+        if version not in pending:
+            continue
+        with db.engine.begin() as connection:
+            migrate(connection)
+            connection.execute(
+                SchemaMigration.__table__.insert().values(version=version, applied_at=datetime.utcnow())
+            )
+        logging.info(f"Applied migration {version}")
+        applied.append(version)
+
+    return applied
+
+@contextmanager
+def _upgrade_lock():
+    # Gunicorn workers boot together and would otherwise all see the same
+    # pending migrations and apply them at once. SQLite is only used by a
+    # single development process.
+    if db.engine.dialect.name != 'postgresql':
+        yield
+        return
+    with db.engine.connect() as connection:
+        connection.exec_driver_sql(f'SELECT pg_advisory_lock({UPGRADE_LOCK_KEY})')
+        try:
+            yield
+        finally:
+            connection.exec_driver_sql(f'SELECT pg_advisory_unlock({UPGRADE_LOCK_KEY})')
+
+def upgrade_database() -> List[str]:
+    """
+    Create missing tables and apply pending migrations while holding the upgrade lock.
+
+    Returns:
+        Versions that were applied
+    """
+    with _upgrade_lock():
+        db.create_all()
+        return run_migrations()
@@ -0,0 +1,206 @@
+import os
+import threading
+import logging
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Persisted model location; training a model opts the app in to learned categorization
+MODEL_PATH = os.environ.get('CATEGORIZER_MODEL_PATH', os.path.join('ml_models', 'categorizer.joblib'))
+
+# Minimum predicted probability before the model overrides the keyword rules
+CONFIDENCE_THRESHOLD = 0.6
+
+# Number of descriptions vectorized and scored at a time
+BATCH_SIZE = 50000
+
+# Size of the hashed feature space; the dense coef_ of the classifier is
+# classes x N_FEATURES floats and is loaded in every worker process
+N_FEATURES = 2 ** 18
+
+_vectorizers = {}
+_model = None
+_model_mtime = None
+_model_lock = threading.Lock()
+
+def is_available() -> bool:
+    """Check whether scikit-learn is installed."""
+    try:
+        import sklearn  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _get_vectorizer(n_features: int = N_FEATURES):
+    """Return the shared stateless hashing vectorizer for a feature space size."""
+    vectorizer = _vectorizers.get(n_features)
+    if vectorizer is None:
+        from sklearn.feature_extraction.text import HashingVectorizer
+        vectorizer = HashingVectorizer(
+            analyzer='char_wb',
+            ngram_range=(3, 5),
+            n_features=n_features,
+            alternate_sign=False,
+            lowercase=True
+        )
+        _vectorizers[n_features] = vectorizer
+    return vectorizer
+
+def _model_vectorizer(model):
+    """Return the vectorizer matching the feature space a model was trained with."""
+    return _get_vectorizer(model.coef_.shape[1])
+
+def _batches(descriptions: pd.Series, labels: Optional[pd.Series] = None):
+    for start in range(0, len(descriptions), BATCH_SIZE):
+        stop = start + BATCH_SIZE
+        if labels is None:
+            yield descriptions.iloc[start:stop]
+        else:
+            yield descriptions.iloc[start:stop], labels.iloc[start:stop]
+
+def train_model(descriptions: pd.Series, labels: pd.Series, classes: List[str], epochs: int = 5):
+    """
+    Train a linear classifier on labeled transaction descriptions.
+
+    Args:
+        descriptions: Series of transaction descriptions
+        labels: Series of category names aligned with descriptions
+        classes: Every category the model may predict or learn later
+        epochs: Number of shuffled passes over the data
+
+    Returns:
+        Fitted SGDClassifier
+    """
+    from sklearn.linear_model import SGDClassifier
+
+    classifier = SGDClassifier(loss='log_loss', alpha=1e-5, random_state=0)
+    vectorizer = _get_vectorizer()
+    all_classes = np.array(sorted(set(classes) | set(labels.unique())))
+
+    for epoch in range(epochs):
+        order = np.random.RandomState(epoch).permutation(len(descriptions))
+        shuffled_descriptions = descriptions.iloc[order]
+        shuffled_labels = labels.iloc[order]
+        for batch_descriptions, batch_labels in _batches(shuffled_descriptions, shuffled_labels):
+            features = vectorizer.transform(batch_descriptions.astype(str))
+            classifier.partial_fit(features, batch_labels.values, classes=all_classes)
+
+    return classifier
+
+def save_model(model, path: str = MODEL_PATH) -> None:
+    """
+    Persist a model to disk, replacing any previous one atomically.
+
+    Args:
+        model: Fitted classifier
+        path: Destination file path
+    """
+    import joblib
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    joblib.dump(model, temp_path)
+    os.replace(temp_path, path)
+
+def get_model(path: str = MODEL_PATH):
+    """
+    Get the persisted model, reloading it when the file changes on disk.
+
+    Returns:
+        Fitted classifier, or None when no model has been trained
+    """
+    global _model, _model_mtime
+
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+
+    if _model is not None and mtime == _model_mtime:
+        return _model
+
+    if not is_available():
+        return None
+
+    with _model_lock:
+        if _model is None or mtime != _model_mtime:
+            import joblib
+            try:
+                _model = joblib.load(path)
+                _model_mtime = mtime
+            except Exception as e:
+                logging.error(f"Error loading categorizer model: {e}")
+                return None
+
+    return _model
+
+def model_version():
+    """Identify the loaded model, so predictions cached for an older one are not reused."""
+    return _model_mtime
+
+def predict_categories(descriptions: pd.Series, model=None) -> pd.Series:
+    """
+    Predict categories for many descriptions in large batches.
+
+    Args:
+        descriptions: Series of transaction descriptions
+        model: Classifier to use, defaults to the persisted model
+
+    Returns:
+        Series of category names aligned with the input index, with None
+        wherever the model is missing or below CONFIDENCE_THRESHOLD
+    """
+    predictions = pd.Series(None, index=descriptions.index, dtype=object, name='category')
+
+    if model is None:
+        model = get_model()
+    if model is None or descriptions.empty:
+        return predictions
+
+    vectorizer = _model_vectorizer(model)
+    results = []
+    for batch in _batches(descriptions.fillna('').astype(str)):
+        probabilities = model.predict_proba(vectorizer.transform(batch))
+        best = probabilities.argmax(axis=1)
+        confident = probabilities[np.arange(len(best)), best] >= CONFIDENCE_THRESHOLD
+        results.append(np.where(confident, model.classes_[best].astype(object), None))
+
+    predictions[:] = np.concatenate(results)
+    return predictions
+
+def update_model(descriptions: List[str], labels: List[str], path: str = MODEL_PATH) -> List[int]:
+    """
+    Incrementally train the persisted model on corrected labels.
+
+    Args:
+        descriptions: Transaction descriptions
+        labels: Correct category for each description
+        path: Model file to update
+
+    Returns:
+        Indexes of the examples the model learned from; labels the model
+        was not trained with cannot be learned incrementally and are skipped
+    """
+    global _model_mtime
+
+    model = get_model(path)
+    if model is None:
+        return []
+
+    known = set(model.classes_)
+    used = [i for i, label in enumerate(labels) if label in known]
+    if not used:
+        return []
+
+    features = _model_vectorizer(model).transform([descriptions[i] for i in used])
+    with _model_lock:
+        model.partial_fit(features, [labels[i] for i in used])
+        save_model(model, path)
+        if model is _model:
+            _model_mtime = os.stat(path).st_mtime
+
+    return used
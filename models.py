@@ -3,6 +3,7 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db
+from statement_parser import MAX_DESCRIPTION_LENGTH
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -10,12 +11,22 @@ class User(UserMixin, db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(256), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped by every write to the user's data; keys cached dashboard data
+    data_version = db.Column(db.Integer, default=0)
     
     # Relationships
     transactions = db.relationship('Transaction', backref='user', lazy=True, cascade='all, delete-orphan')
     goals = db.relationship('Goal', backref='user', lazy=True, cascade='all, delete-orphan')
     debts = db.relationship('Debt', backref='user', lazy=True, cascade='all, delete-orphan')
     badges = db.relationship('UserBadge', backref='user', lazy=True, cascade='all, delete-orphan')
+    category_rules = db.relationship('CategoryRule', backref='user', lazy=True, cascade='all, delete-orphan')
+    import_jobs = db.relationship('ImportJob', backref='user', lazy=True, cascade='all, delete-orphan')
+    rollups = db.relationship('MonthlyRollup', backref='user', lazy=True, cascade='all, delete-orphan')
+    insight_snapshot = db.relationship('InsightSnapshot', backref='user', uselist=False, cascade='all, delete-orphan')
+    forecasts = db.relationship('SpendingForecast', backref='user', lazy=True, cascade='all, delete-orphan')
+    weekly_spending = db.relationship('WeeklySpending', backref='user', lazy=True, cascade='all, delete-orphan')
+    spending_stats = db.relationship('SpendingStats', backref='user', lazy=True, cascade='all, delete-orphan')
+    spending_alerts = db.relationship('SpendingAlert', backref='user', lazy=True, cascade='all, delete-orphan')
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -27,17 +38,192 @@ class User(UserMixin, db.Model):
         return f'<User {self.username}>'
 
 class Transaction(db.Model):
+    # Re-imported rows share a fingerprint and occurrence and are skipped.
+    # Changes to these indexes need a migration in migrations.py as well.
+    __table_args__ = (
+        db.Index('ix_transaction_fingerprint', 'fingerprint', 'occurrence', unique=True),
+        db.Index('ix_transaction_user_date', 'user_id', 'date'),
+        db.Index('ix_transaction_user_category', 'user_id', 'category'),
+        db.Index('ix_transaction_user_amount', 'user_id', 'amount'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     date = db.Column(db.Date, nullable=False)
     amount = db.Column(db.Float, nullable=False)
-    description = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.String(MAX_DESCRIPTION_LENGTH), nullable=False)
     category = db.Column(db.String(50), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Hash of user, date, amount and normalized description
+    fingerprint = db.Column(db.String(32))
+    # Counts identical rows within an import so legitimate repeats are kept
+    occurrence = db.Column(db.Integer, default=1)
     
     def __repr__(self):
         return f'<Transaction {self.description}: {self.amount}>'
 
+class MonthlyRollup(db.Model):
+    # Totals of a user's transactions per month and category; see rollups.py
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    year_month = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    category = db.Column(db.String(50), primary_key=True)
+    income = db.Column(db.Float, nullable=False, default=0.0)
+    expenses = db.Column(db.Float, nullable=False, default=0.0)  # Positive sum of negative amounts
+    count = db.Column(db.Integer, nullable=False, default=0)
+    expense_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    @property
+    def net(self):
+        return self.income - self.expenses
+    
+    def __repr__(self):
+        return f'<MonthlyRollup {self.user_id} {self.year_month} {self.category}>'
+
+class WeeklySpending(db.Model):
+    # Expenses per user, category and week; see spending_stats.py
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    category = db.Column(db.String(50), primary_key=True)
+    week_start = db.Column(db.Date, primary_key=True)  # Monday
+    total = db.Column(db.Float, nullable=False, default=0.0)  # Positive sum of negative amounts
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<WeeklySpending {self.user_id} {self.category} {self.week_start}: {self.total}>'
+
+class SpendingStats(db.Model):
+    # Running mean and variance (Welford) of a category's weekly spending
+    # over the weeks it has any; see spending_stats.py
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    category = db.Column(db.String(50), primary_key=True)
+    weeks = db.Column(db.Integer, nullable=False, default=0)
+    mean = db.Column(db.Float, nullable=False, default=0.0)
+    m2 = db.Column(db.Float, nullable=False, default=0.0)  # Sum of squared deviations from the mean
+    
+    @property
+    def variance(self):
+        return self.m2 / (self.weeks - 1) if self.weeks > 1 else 0.0
+    
+    def __repr__(self):
+        return f'<SpendingStats {self.user_id} {self.category}: {self.weeks} weeks>'
+
+class SpendingAlert(db.Model):
+    # Unusual weekly spending, raised once per category and week as transactions arrive
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'category', 'week_start'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    week_start = db.Column(db.Date, nullable=False)
+    total = db.Column(db.Float, nullable=False)  # Spending in the week when the alert fired
+    usual = db.Column(db.Float, nullable=False)  # Mean weekly spending of the other weeks
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SpendingAlert {self.user_id} {self.category} {self.week_start}>'
+
+class InsightSnapshot(db.Model):
+    # Last computed insights and health score of a user; see snapshots.py
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    data_version = db.Column(db.Integer, nullable=False)  # User.data_version the snapshot was computed from
+    computed_on = db.Column(db.Date, nullable=False)  # Insights compare against the current month and week
+    insights = db.Column(db.JSON, nullable=False)
+    health_score = db.Column(db.Integer, nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def is_current(self, data_version, today):
+        return self.data_version == (data_version or 0) and self.computed_on == today
+    
+    def __repr__(self):
+        return f'<InsightSnapshot {self.user_id} v{self.data_version}>'
+
+class SpendingForecast(db.Model):
+    # Next month's spending per user and category from the batch forecaster; see forecasts.py
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    category = db.Column(db.String(50))  # None for all categories together
+    year_month = db.Column(db.String(7), nullable=False)  # YYYY-MM being forecast
+    amount = db.Column(db.Float, nullable=False)
+    months_used = db.Column(db.Integer, nullable=False)  # Months of history the trend was fitted to
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SpendingForecast {self.user_id} {self.category or "all"} {self.year_month}: {self.amount}>'
+
+class CategoryRule(db.Model):
+    # Never reuse ids, so (count, max id) identifies a user's rule set
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'category', 'keyword'),
+        {'sqlite_autoincrement': True},
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    category = db.Column(db.String(50), nullable=False)
+    keyword = db.Column(db.String(100), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<CategoryRule {self.user_id}: {self.keyword} -> {self.category}>'
+
+class ImportJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    filename = db.Column(db.String(255))
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    rows_added = db.Column(db.Integer, default=0)
+    rows_failed = db.Column(db.Integer, default=0)
+    rows_duplicate = db.Column(db.Integer, default=0)
+    error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    # Bumped by every progress update; a job that stops updating has lost its worker
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    errors = db.relationship('ImportJobError', backref='job', lazy='dynamic', cascade='all, delete-orphan',
+                             order_by='ImportJobError.row_number')
+    
+    @property
+    def rows_processed(self):
+        return (self.rows_added or 0) + (self.rows_failed or 0) + (self.rows_duplicate or 0)
+    
+    @property
+    def throughput(self):
+        if not self.started_at:
+            return 0
+        elapsed = ((self.finished_at or datetime.utcnow()) - self.started_at).total_seconds()
+        if elapsed <= 0:
+            return 0
+        return self.rows_processed / elapsed
+    
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+    
+    def is_stalled(self, timeout):
+        # Queued jobs live in one process's memory and are lost when it restarts
+        if self.status == 'queued':
+            last_progress = self.created_at
+        elif self.status == 'running':
+            last_progress = self.updated_at or self.started_at or self.created_at
+        else:
+            return False
+        return datetime.utcnow() - last_progress > timeout
+    
+    def __repr__(self):
+        return f'<ImportJob {self.id}: {self.status}>'
+
+class ImportJobError(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('import_job.id'), nullable=False, index=True)
+    row_number = db.Column(db.Integer, nullable=False)
+    message = db.Column(db.String(500), nullable=False)
+    
+    def __repr__(self):
+        return f'<ImportJobError {self.job_id}: row {self.row_number}>'
+
 class Goal(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -100,3 +286,30 @@ class UserBadge(db.Model):
     
     def __repr__(self):
         return f'<UserBadge {self.user_id}: {self.badge_id}>'
+
+class AnalyticsRun(db.Model):
+    # Checkpoint of a batch analytics run; see analytics.py
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='running')  # running, completed, abandoned
+    # Every user with an id up to this one has been processed
+    last_user_id = db.Column(db.Integer, nullable=False, default=0)
+    users_processed = db.Column(db.Integer, nullable=False, default=0)
+    users_failed = db.Column(db.Integer, nullable=False, default=0)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<AnalyticsRun {self.id}: {self.status}>'
+
+class SchemaMigration(db.Model):
+    version = db.Column(db.String(100), primary_key=True)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SchemaMigration {self.version}>'
+
+def bump_data_version(user_id):
+    """Mark a user's data as changed; committed with the caller's transaction"""
+    db.session.execute(
+        db.update(User).where(User.id == user_id).values(data_version=db.func.coalesce(User.data_version, 0) + 1)
+    )
@@ -0,0 +1,58 @@
+import base64
+import binascii
+from datetime import date
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+from models import Transaction
+
+def encode_cursor(transaction) -> str:
+    """Encode the (date, id) position of a transaction as an opaque cursor."""
+    value = f'{transaction.date.isoformat()}|{transaction.id}'
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[date, int]:
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        value = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        date_part, id_part = value.split('|')
+        return date.fromisoformat(date_part), int(id_part)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('Invalid cursor.')
+
+def transaction_page(query, limit: int, cursor: Optional[str] = None) -> Tuple[List[Transaction], Optional[str]]:
+    """
+    Fetch one page of transactions, newest first, continuing after a cursor.
+
+    Seeks on (date, id) rather than using OFFSET, so every page costs the
+    same however deep into the history it is.
+
+    Args:
+        query: Transaction query with any filters applied
+        limit: Maximum transactions to return
+        cursor: Position returned with the previous page
+
+    Returns:
+        Tuple of the transactions and the cursor of the next page, or None
+        on the last page
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    if cursor:
+        after_date, after_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Transaction.date < after_date,
+            and_(Transaction.date == after_date, Transaction.id < after_id)
+        ))
+
+    # One extra row tells whether another page exists
+    rows = query.order_by(Transaction.date.desc(), Transaction.id.desc()).limit(limit + 1).all()
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1]) if len(rows) > limit else None
+    return page, next_cursor
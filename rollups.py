@@ -0,0 +1,261 @@
+import logging
+from datetime import date, timedelta
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import case, extract, func, insert
+from app import db
+from models import Transaction, MonthlyRollup
+
+# Columns that are summed when transactions are added or removed
+SUM_COLUMNS = ['income', 'expenses', 'count', 'expense_count']
+
+KEY_COLUMNS = ['user_id', 'year_month', 'category']
+
+def month_key(value) -> str:
+    """Return the YYYY-MM rollup key for a date."""
+    return f'{value.year:04d}-{value.month:02d}'
+
+def summarize(rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    Group transactions into rollup rows.
+
+    Args:
+        rows: Frame with user_id, date, amount and category columns
+
+    Returns:
+        Frame with one row per user, month and category
+    """
+    amounts = rows['amount'].astype(float)
+    frame = pd.DataFrame({
+        'user_id': rows['user_id'].astype(int),
+        'year_month': pd.to_datetime(rows['date']).dt.strftime('%Y-%m'),
+        'category': rows['category'],
+        'income': amounts.where(amounts > 0, 0.0),
+        'expenses': (-amounts).where(amounts < 0, 0.0),
+        'count': 1,
+        'expense_count': (amounts < 0).astype(int),
+    })
+    return frame.groupby(KEY_COLUMNS, as_index=False, sort=False).sum()
+
+def _upsert_statement():
+    """INSERT that adds to the sums of an existing rollup row."""
+    table = MonthlyRollup.__table__
+    dialect = db.engine.dialect.name
+
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+
+    statement = dialect_insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=KEY_COLUMNS,
+        set_={column: table.c[column] + statement.excluded[column] for column in SUM_COLUMNS}
+    )
+
+def apply_transactions(rows: pd.DataFrame, sign: int = 1) -> None:
+    """
+    Add transactions to the rollup, or remove them with sign=-1.
+
+    Runs in the caller's database transaction so the rollup commits or
+    rolls back together with the transactions themselves.
+
+    Args:
+        rows: Frame with user_id, date, amount and category columns
+        sign: 1 for inserted transactions, -1 for deleted ones
+    """
+    if rows.empty:
+        return
+
+    delta = summarize(rows)
+    if sign < 0:
+        delta[SUM_COLUMNS] = -delta[SUM_COLUMNS]
+    records = delta.to_dict('records')
+
+    statement = _upsert_statement()
+    if statement is not None:
+        db.session.execute(statement, records)
+    else:
+        for record in records:
+            rollup = db.session.get(MonthlyRollup, tuple(record[column] for column in KEY_COLUMNS))
+            if rollup is None:
+                rollup = MonthlyRollup(**{column: record[column] for column in KEY_COLUMNS},
+                                       income=0.0, expenses=0.0, count=0, expense_count=0)
+                db.session.add(rollup)
+            for column in SUM_COLUMNS:
+                setattr(rollup, column, getattr(rollup, column) + record[column])
+        db.session.flush()
+
+    if sign < 0:
+        # Months and categories without transactions left are removed
+        MonthlyRollup.query.filter(
+            MonthlyRollup.user_id.in_(delta['user_id'].unique().tolist()),
+            MonthlyRollup.count <= 0
+        ).delete(synchronize_session=False)
+
+def apply_transaction(transaction: Transaction, sign: int = 1) -> None:
+    """Add or remove a single transaction from the rollup."""
+    apply_transactions(pd.DataFrame([{
+        'user_id': transaction.user_id,
+        'date': transaction.date,
+        'amount': transaction.amount,
+        'category': transaction.category
+    }]), sign)
+
+def rebuild_rollups(user_id: Optional[int] = None) -> int:
+    """
+    Recompute the rollup from raw transactions.
+
+    Args:
+        user_id: Rebuild only this user, or every user when None
+
+    Returns:
+        Number of rollup rows written
+    """
+    year = extract('year', Transaction.date)
+    month = extract('month', Transaction.date)
+    query = db.session.query(
+        Transaction.user_id, year, month, Transaction.category,
+        func.sum(case((Transaction.amount > 0, Transaction.amount), else_=0.0)),
+        func.sum(case((Transaction.amount < 0, -Transaction.amount), else_=0.0)),
+        func.count(Transaction.id),
+        func.sum(case((Transaction.amount < 0, 1), else_=0))
+    ).group_by(Transaction.user_id, year, month, Transaction.category)
+
+    existing = MonthlyRollup.query
+    if user_id is not None:
+        query = query.filter(Transaction.user_id == user_id)
+        existing = existing.filter(MonthlyRollup.user_id == user_id)
+
+    records = [{
+        'user_id': row_user_id,
+        'year_month': f'{int(row_year):04d}-{int(row_month):02d}',
+        'category': category,
+        'income': income or 0.0,
+        'expenses': expenses or 0.0,
+        'count': count,
+        'expense_count': expense_count or 0
+    } for row_user_id, row_year, row_month, category, income, expenses, count, expense_count in query]
+
+    try:
+        existing.delete(synchronize_session=False)
+        if records:
+            db.session.execute(insert(MonthlyRollup.__table__), records)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    logging.info(f"Rebuilt {len(records)} rollup rows" + (f" for user {user_id}" if user_id else ""))
+    return len(records)
+
+def rebuild_if_empty() -> Optional[int]:
+    """
+    Build the rollup for databases that have transactions from before it existed.
+
+    Returns:
+        Number of rollup rows written, or None if nothing needed building
+    """
+    if MonthlyRollup.query.first() is None and Transaction.query.first() is not None:
+        return rebuild_rollups()
+    return None
+
+# Readers
+
+def get_totals(user_id: int) -> Tuple[float, float]:
+    """Return a user's total income and expenses."""
+    income, expenses = db.session.query(
+        func.sum(MonthlyRollup.income), func.sum(MonthlyRollup.expenses)
+    ).filter(MonthlyRollup.user_id == user_id).one()
+    return income or 0, expenses or 0
+
+def get_transaction_count(user_id: int) -> int:
+    """Return the number of transactions a user has."""
+    count = db.session.query(func.sum(MonthlyRollup.count)).filter(MonthlyRollup.user_id == user_id).scalar()
+    return count or 0
+
+def get_category_count(user_id: int) -> int:
+    """Return the number of distinct categories a user has transactions in."""
+    return db.session.query(func.count(func.distinct(MonthlyRollup.category))).filter(
+        MonthlyRollup.user_id == user_id
+    ).scalar()
+
+def get_category_totals(user_id: int) -> Dict[str, Dict]:
+    """Return expense total and count per category, for categories with expenses."""
+    rows = db.session.query(
+        MonthlyRollup.category, func.sum(MonthlyRollup.expenses), func.sum(MonthlyRollup.expense_count)
+    ).filter(
+        MonthlyRollup.user_id == user_id,
+        MonthlyRollup.expense_count > 0
+    ).group_by(MonthlyRollup.category).order_by(MonthlyRollup.category)
+    return {category: {'total': total, 'count': count} for category, total, count in rows}
+
+def get_monthly_totals(user_id: int) -> Dict[str, Dict]:
+    """Return income, expenses and expense count per month, oldest month first."""
+    rows = db.session.query(
+        MonthlyRollup.year_month, func.sum(MonthlyRollup.income),
+        func.sum(MonthlyRollup.expenses), func.sum(MonthlyRollup.expense_count)
+    ).filter(MonthlyRollup.user_id == user_id).group_by(MonthlyRollup.year_month).order_by(MonthlyRollup.year_month)
+    return {
+        year_month: {'income': income, 'expenses': expenses, 'expense_count': expense_count}
+        for year_month, income, expenses, expense_count in rows
+    }
+
+def get_month_totals(user_id: int, year: int, month: int) -> Dict:
+    """Return income, expenses and expense count for one calendar month."""
+    income, expenses, expense_count = db.session.query(
+        func.sum(MonthlyRollup.income), func.sum(MonthlyRollup.expenses), func.sum(MonthlyRollup.expense_count)
+    ).filter(
+        MonthlyRollup.user_id == user_id,
+        MonthlyRollup.year_month == f'{year:04d}-{month:02d}'
+    ).one()
+    return {'income': income or 0, 'expenses': expenses or 0, 'expense_count': expense_count or 0}
+
+def _first_of_next_month(value: date) -> date:
+    return (value.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+def _raw_totals(user_id: int, start_date: date, end_date: date) -> Tuple[float, float]:
+    income, expenses = db.session.query(
+        func.sum(case((Transaction.amount > 0, Transaction.amount), else_=0.0)),
+        func.sum(case((Transaction.amount < 0, -Transaction.amount), else_=0.0))
+    ).filter(
+        Transaction.user_id == user_id,
+        Transaction.date >= start_date,
+        Transaction.date <= end_date
+    ).one()
+    return income or 0, expenses or 0
+
+def get_range_totals(user_id: int, start_date: date, end_date: date) -> Tuple[float, float]:
+    """
+    Return income and expenses between two dates, inclusive.
+
+    Whole months are read from the rollup; only the partial months at
+    either end of the range are summed from raw transactions.
+    """
+    first_full = start_date if start_date.day == 1 else _first_of_next_month(start_date)
+    next_month = _first_of_next_month(end_date)
+    after_last_full = next_month if end_date == next_month - timedelta(days=1) else end_date.replace(day=1)
+
+    if first_full >= after_last_full:
+        return _raw_totals(user_id, start_date, end_date)
+
+    income, expenses = db.session.query(
+        func.sum(MonthlyRollup.income), func.sum(MonthlyRollup.expenses)
+    ).filter(
+        MonthlyRollup.user_id == user_id,
+        MonthlyRollup.year_month >= month_key(first_full),
+        MonthlyRollup.year_month < month_key(after_last_full)
+    ).one()
+    income, expenses = income or 0, expenses or 0
+
+    if start_date < first_full:
+        head = _raw_totals(user_id, start_date, first_full - timedelta(days=1))
+        income, expenses = income + head[0], expenses + head[1]
+    if after_last_full <= end_date:
+        tail = _raw_totals(user_id, after_last_full, end_date)
+        income, expenses = income + tail[0], expenses + tail[1]
+
+    return income, expenses
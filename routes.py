@@ -1,21 +1,35 @@
 import os
-import csv
 import pandas as pd
 from datetime import datetime, timedelta
 from flask import render_template, request, redirect, url_for, flash, send_file, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.utils import secure_filename
+from werkzeug.wsgi import get_input_stream
 from sqlalchemy import func, extract
 from app import app, db
-from models import User, Transaction, Goal, Debt, Badge, UserBadge
-from insights import generate_insights, predict_spending
-from badges import check_and_award_badges, initialize_badges
-from categorizer import categorize_transaction
+from models import User, Transaction, ImportJob, Goal, Debt, Badge, UserBadge, bump_data_version
+from insights import predict_spending
+from badges import (check_and_award_badges, initialize_badges, TRANSACTIONS_DELETED,
+                    GOAL_CREATED, GOAL_UPDATED, DEBT_CREATED, DEBT_UPDATED)
+from jobs import enqueue_import, job_status, fail_stalled_jobs
+from rollups import apply_transaction, get_range_totals
+from spending_stats import update_transaction_stats
+from dashboard import get_dashboard_context, CHART_SERIES
+from pagination import transaction_page
+from timeseries import get_time_series
+from importer import file_format as file_format_for, columnar_available
 import logging
 
-# Initialize badges on startup
+# Report types exported as data files, with their file extensions
+EXPORT_FORMATS = {
+    'csv': 'csv',
+    'parquet': 'parquet',
+    'arrow': 'arrow',
+}
+
+# Initialize badges and clean up imports interrupted by a restart on startup
 with app.app_context():
     initialize_badges()
+    fail_stalled_jobs()
 
 @app.route('/')
 def index():
@@ -93,58 +107,11 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    # Get user's transactions
-    transactions = Transaction.query.filter_by(user_id=current_user.id).order_by(Transaction.date.desc()).all()
-    
-    # Calculate basic statistics
-    total_income = sum(t.amount for t in transactions if t.amount > 0)
-    total_expenses = sum(abs(t.amount) for t in transactions if t.amount < 0)
-    net_worth = total_income - total_expenses
-    
-    # Get recent transactions
-    recent_transactions = transactions[:10]
-    
-    # Category-wise spending
-    category_spending = {}
-    for transaction in transactions:
-        if transaction.amount < 0:  # Only expenses
-            category = transaction.category
-            category_spending[category] = category_spending.get(category, 0) + abs(transaction.amount)
-    
-    # Monthly spending data
-    monthly_data = {}
-    for transaction in transactions:
-        month_key = transaction.date.strftime('%Y-%m')
-        if month_key not in monthly_data:
-            monthly_data[month_key] = {'income': 0, 'expenses': 0}
-        
-        if transaction.amount > 0:
-            monthly_data[month_key]['income'] += transaction.amount
-        else:
-            monthly_data[month_key]['expenses'] += abs(transaction.amount)
-    
-    # Generate insights
-    insights = generate_insights(current_user.id)
-    
-    # Get user's goals
-    goals = Goal.query.filter_by(user_id=current_user.id).all()
-    
-    # Get user's badges
-    user_badges = UserBadge.query.filter_by(user_id=current_user.id).join(Badge).all()
-    
-    # Check for new badges
-    check_and_award_badges(current_user.id)
-    
-    return render_template('dashboard.html',
-                         total_income=total_income,
-                         total_expenses=total_expenses,
-                         net_worth=net_worth,
-                         recent_transactions=recent_transactions,
-                         category_spending=category_spending,
-                         monthly_data=monthly_data,
-                         insights=insights,
-                         goals=goals,
-                         user_badges=user_badges)
+    # Reuse the computed page data until the user's data changes; badges are
+    # awarded by the writes that can earn them, so viewing never writes
+    context = get_dashboard_context(current_user.id, current_user.data_version)
+    
+    return render_template('dashboard.html', **context)
 
 @app.route('/upload', methods=['GET', 'POST'])
 @login_required
@@ -159,84 +126,147 @@ def upload():
             flash('No file selected.', 'error')
             return redirect(request.url)
         
-        if file and file.filename.endswith('.csv'):
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+        file_format = file_format_for(file.filename)
+        if file and file_format:
+            if file_format in ('parquet', 'arrow') and not columnar_available():
+                flash('Parquet and Arrow uploads require pyarrow to be installed.', 'error')
+                return redirect(request.url)
             
-            try:
-                # Process CSV file
-                df = pd.read_csv(filepath)
-                
-                # Validate required columns
-                required_columns = ['date', 'amount', 'description']
-                missing_columns = [col for col in required_columns if col not in df.columns]
-                
-                if missing_columns:
-                    flash(f'CSV must contain columns: {", ".join(missing_columns)}', 'error')
-                    return redirect(request.url)
-                
-                # Process transactions
-                transactions_added = 0
-                errors = []
-                
-                for index, row in df.iterrows():
-                    try:
-                        # Parse date
-                        date_obj = pd.to_datetime(row['date']).date()
-                        
-                        # Get amount
-                        amount = float(row['amount'])
-                        
-                        # Get description
-                        description = str(row['description']).strip()
-                        
-                        if not description:
-                            errors.append(f"Row {index + 1}: Empty description")
-                            continue
-                        
-                        # Auto-categorize
-                        category = categorize_transaction(description)
-                        
-                        # Create transaction
-                        transaction = Transaction(
-                            user_id=current_user.id,
-                            date=date_obj,
-                            amount=amount,
-                            description=description,
-                            category=category
-                        )
-                        db.session.add(transaction)
-                        transactions_added += 1
-                        
-                    except Exception as e:
-                        errors.append(f"Row {index + 1}: {str(e)}")
-                        continue
-                
-                db.session.commit()
-                
-                if transactions_added > 0:
-                    flash(f'Successfully imported {transactions_added} transactions!', 'success')
-                    # Check for new badges
-                    check_and_award_badges(current_user.id)
-                
-                if errors:
-                    flash(f'Encountered {len(errors)} errors during import.', 'warning')
-                
-                return redirect(url_for('dashboard'))
-                
-            except Exception as e:
-                flash(f'Error processing file: {str(e)}', 'error')
-                logging.error(f"CSV processing error: {e}")
-            
-            finally:
-                # Clean up uploaded file
-                if os.path.exists(filepath):
-                    os.remove(filepath)
+            # Queue the import and report progress on the upload page
+            job = enqueue_import(file.stream, current_user.id, file.filename, file_format)
+            return redirect(url_for('upload', job=job.id))
         else:
-            flash('Please upload a CSV file.', 'error')
+            flash('Please upload a CSV, Parquet, Arrow or zip file.', 'error')
+    
+    # Resume progress reporting for a queued import
+    job = None
+    job_id = request.args.get('job', type=int)
+    if job_id:
+        job = ImportJob.query.filter_by(id=job_id, user_id=current_user.id).first()
+    
+    return render_template('upload.html', job=job)
+
+@app.route('/upload/stream', methods=['POST'])
+@login_required
+def upload_stream():
+    # The body is the raw file, read without the MAX_CONTENT_LENGTH limit and
+    # spooled for import in the background (see jobs.enqueue_import)
+    filename = request.args.get('filename')
+    file_format = file_format_for(filename) if filename else 'csv'
+    if not file_format:
+        return jsonify({'error': 'Please upload a CSV, Parquet, Arrow or zip file.'}), 400
+    if file_format in ('parquet', 'arrow') and not columnar_available():
+        return jsonify({'error': 'Parquet and Arrow uploads require pyarrow to be installed.'}), 400
+    
+    stream = get_input_stream(request.environ, max_content_length=app.config['MAX_STREAM_CONTENT_LENGTH'])
+    job = enqueue_import(stream, current_user.id, filename, file_format)
+    
+    return jsonify({
+        'job_id': job.id,
+        'status_url': url_for('import_job_status', job_id=job.id)
+    }), 202
+
+@app.route('/upload/jobs/<int:job_id>')
+@login_required
+def import_job_status(job_id):
+    job = ImportJob.query.filter_by(id=job_id, user_id=current_user.id).first()
+    if not job:
+        return jsonify({'error': 'Import job not found.'}), 404
+    
+    return jsonify(job_status(job))
+
+@app.route('/api/transactions')
+@login_required
+def api_transactions():
+    limit = request.args.get('limit', app.config['API_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['API_MAX_PAGE_SIZE']))
+    
+    query = Transaction.query.filter_by(user_id=current_user.id)
+    
+    try:
+        start_date = request.args.get('start_date')
+        if start_date:
+            query = query.filter(Transaction.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
+        
+        end_date = request.args.get('end_date')
+        if end_date:
+            query = query.filter(Transaction.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
+    except ValueError:
+        return jsonify({'error': 'Dates must use the YYYY-MM-DD format.'}), 400
+    
+    category = request.args.get('category')
+    if category:
+        query = query.filter(Transaction.category == category)
+    
+    transaction_type = request.args.get('type')
+    if transaction_type == 'income':
+        query = query.filter(Transaction.amount > 0)
+    elif transaction_type == 'expense':
+        query = query.filter(Transaction.amount < 0)
+    elif transaction_type:
+        return jsonify({'error': "Type must be 'income' or 'expense'."}), 400
+    
+    try:
+        transactions, next_cursor = transaction_page(query, limit, request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return render_template('upload.html')
+    return jsonify({
+        'transactions': [{
+            'id': t.id,
+            'date': t.date.isoformat(),
+            'amount': t.amount,
+            'description': t.description,
+            'category': t.category
+        } for t in transactions],
+        'next_cursor': next_cursor
+    })
+
+@app.route('/api/charts/<series>')
+@login_required
+def chart_data(series):
+    if series not in CHART_SERIES:
+        return jsonify({'error': 'Unknown chart.'}), 404
+    
+    # Series only change when the user's data does, so the version identifies the content
+    etag = f'{current_user.id}-{current_user.data_version or 0}-{series}'
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(CHART_SERIES[series](current_user.id))
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/api/timeseries')
+@login_required
+def timeseries_data():
+    max_points = app.config['TIMESERIES_MAX_POINTS']
+    points = max(1, min(request.args.get('points', max_points, type=int), max_points))
+    resolution = request.args.get('resolution', 'auto')
+    
+    try:
+        start_date = request.args.get('start_date')
+        start_date = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+        end_date = request.args.get('end_date')
+        end_date = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+    except ValueError:
+        return jsonify({'error': 'Dates must use the YYYY-MM-DD format.'}), 400
+    
+    # Like chart series, a bucketed range only changes when the user's data does
+    etag = f'{current_user.id}-{current_user.data_version or 0}-timeseries-{start_date}-{end_date}-{resolution}-{points}'
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        try:
+            response = jsonify(get_time_series(current_user.id, start_date, end_date, resolution, points))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @app.route('/goals', methods=['GET', 'POST'])
 @login_required
@@ -269,10 +299,14 @@ def goals():
                 target_date=target_date
             )
             db.session.add(goal)
+            bump_data_version(current_user.id)
             db.session.commit()
             
             flash('Goal created successfully!', 'success')
             
+            # Check for new badges
+            check_and_award_badges(current_user.id, GOAL_CREATED)
+            
         except ValueError:
             flash('Invalid input. Please check your values.', 'error')
         
@@ -301,11 +335,12 @@ def update_goal(goal_id):
         if saved_amount >= goal.target_amount:
             goal.is_completed = True
         
+        bump_data_version(current_user.id)
         db.session.commit()
         flash('Goal updated successfully!', 'success')
         
         # Check for new badges
-        check_and_award_badges(current_user.id)
+        check_and_award_badges(current_user.id, GOAL_UPDATED)
         
     except ValueError:
         flash('Invalid amount entered.', 'error')
@@ -349,10 +384,14 @@ def debts():
                 minimum_payment=minimum_payment
             )
             db.session.add(debt)
+            bump_data_version(current_user.id)
             db.session.commit()
             
             flash('Debt added successfully!', 'success')
             
+            # Check for new badges
+            check_and_award_badges(current_user.id, DEBT_CREATED)
+            
         except ValueError:
             flash('Invalid input. Please check your values.', 'error')
         
@@ -382,11 +421,12 @@ def update_debt(debt_id):
         
         debt.current_balance = current_balance
         
+        bump_data_version(current_user.id)
         db.session.commit()
         flash('Debt updated successfully!', 'success')
         
         # Check for new badges
-        check_and_award_badges(current_user.id)
+        check_and_award_badges(current_user.id, DEBT_UPDATED)
         
     except ValueError:
         flash('Invalid amount entered.', 'error')
@@ -418,37 +458,57 @@ def generate_report():
             return redirect(url_for('reports'))
         
         # Get transactions in date range
-        transactions = Transaction.query.filter(
+        query = Transaction.query.filter(
             Transaction.user_id == current_user.id,
             Transaction.date >= start_date,
             Transaction.date <= end_date
-        ).order_by(Transaction.date.desc()).all()
+        ).order_by(Transaction.date.desc())
         
-        if not transactions:
-            flash('No transactions found in the selected date range.', 'warning')
-            return redirect(url_for('reports'))
-        
-        if report_type == 'csv':
-            # Generate CSV report
-            filename = f'transactions_{start_date}_{end_date}.csv'
+        if report_type in EXPORT_FORMATS:
+            if report_type != 'csv' and not columnar_available():
+                flash('Parquet and Arrow exports require pyarrow to be installed.', 'error')
+                return redirect(url_for('reports'))
+            
+            # Read straight into columns; no ORM objects are built for exports
+            export_query = query.with_entities(
+                Transaction.date, Transaction.amount, Transaction.description, Transaction.category
+            )
+            df = pd.read_sql(export_query.statement, db.engine, parse_dates=['date'])
+            
+            if df.empty:
+                flash('No transactions found in the selected date range.', 'warning')
+                return redirect(url_for('reports'))
+            
+            filename = f'transactions_{start_date}_{end_date}.{EXPORT_FORMATS[report_type]}'
             filepath = os.path.join(app.config['REPORTS_FOLDER'], filename)
             
-            with open(filepath, 'w', newline='') as csvfile:
-                fieldnames = ['date', 'amount', 'description', 'category']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
+            if report_type == 'csv':
+                df.to_csv(filepath, index=False, date_format='%Y-%m-%d', lineterminator='\r\n')
+            else:
+                import pyarrow as pa
+                import pyarrow.feather as feather
+                import pyarrow.parquet as pq
                 
-                for transaction in transactions:
-                    writer.writerow({
-                        'date': transaction.date.strftime('%Y-%m-%d'),
-                        'amount': transaction.amount,
-                        'description': transaction.description,
-                        'category': transaction.category
-                    })
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                date_index = table.schema.get_field_index('date')
+                table = table.set_column(date_index, 'date', table['date'].cast(pa.date32()))
+                
+                if report_type == 'parquet':
+                    pq.write_table(table, filepath)
+                else:
+                    feather.write_feather(table, filepath)
             
             return send_file(filepath, as_attachment=True, download_name=filename)
         
-        elif report_type == 'pdf':
+        # Only the rows shown in the report are loaded
+        transaction_count = query.count()
+        transactions = query.limit(50).all()
+        
+        if not transactions:
+            flash('No transactions found in the selected date range.', 'warning')
+            return redirect(url_for('reports'))
+        
+        if report_type == 'pdf':
             # Generate PDF report using ReportLab
             from reportlab.lib.pagesizes import letter
             from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
@@ -468,8 +528,7 @@ def generate_report():
             story.append(Spacer(1, 12))
             
             # Summary
-            total_income = sum(t.amount for t in transactions if t.amount > 0)
-            total_expenses = sum(abs(t.amount) for t in transactions if t.amount < 0)
+            total_income, total_expenses = get_range_totals(current_user.id, start_date, end_date)
             net_worth = total_income - total_expenses
             
             summary_data = [
@@ -496,7 +555,7 @@ def generate_report():
             
             # Transactions table
             trans_data = [['Date', 'Amount', 'Description', 'Category']]
-            for transaction in transactions[:50]:  # Limit to first 50 transactions
+            for transaction in transactions:  # Limit to first 50 transactions
                 trans_data.append([
                     transaction.date.strftime('%Y-%m-%d'),
                     f'${transaction.amount:.2f}',
@@ -518,9 +577,9 @@ def generate_report():
             
             story.append(trans_table)
             
-            if len(transactions) > 50:
+            if transaction_count > 50:
                 story.append(Spacer(1, 12))
-                story.append(Paragraph(f'... and {len(transactions) - 50} more transactions', styles['Normal']))
+                story.append(Paragraph(f'... and {transaction_count - 50} more transactions', styles['Normal']))
             
             doc.build(story)
             return send_file(filepath, as_attachment=True, download_name=filename)
@@ -554,9 +613,15 @@ def badges():
 def delete_transaction(transaction_id):
     transaction = Transaction.query.filter_by(id=transaction_id, user_id=current_user.id).first()
     if transaction:
+        apply_transaction(transaction, sign=-1)
+        update_transaction_stats(transaction, sign=-1)
         db.session.delete(transaction)
+        bump_data_version(current_user.id)
         db.session.commit()
         flash('Transaction deleted successfully!', 'success')
+        
+        # Check for new badges
+        check_and_award_badges(current_user.id, TRANSACTIONS_DELETED)
     else:
         flash('Transaction not found.', 'error')
     
@@ -568,6 +633,7 @@ def delete_goal(goal_id):
     goal = Goal.query.filter_by(id=goal_id, user_id=current_user.id).first()
     if goal:
         db.session.delete(goal)
+        bump_data_version(current_user.id)
         db.session.commit()
         flash('Goal deleted successfully!', 'success')
     else:
@@ -581,6 +647,7 @@ def delete_debt(debt_id):
     debt = Debt.query.filter_by(id=debt_id, user_id=current_user.id).first()
     if debt:
         db.session.delete(debt)
+        bump_data_version(current_user.id)
         db.session.commit()
         flash('Debt deleted successfully!', 'success')
     else:
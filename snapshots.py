@@ -0,0 +1,69 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+from sqlalchemy.exc import IntegrityError
+from app import app, db
+from models import User, InsightSnapshot
+from insights import generate_insights, get_financial_health_score, load_transactions
+
+# Recomputes run off the request thread; users with a refresh already queued
+# are not queued again
+_executor = ThreadPoolExecutor(max_workers=app.config['INSIGHT_WORKERS'], thread_name_prefix='insights')
+_pending = set()
+_pending_lock = threading.Lock()
+
+def compute_snapshot(user_id):
+    """Compute and store a user's insights and health score, returning the snapshot"""
+    # Read the version first so writes made while computing leave the snapshot stale
+    data_version = db.session.query(User.data_version).filter(User.id == user_id).scalar() or 0
+    df = load_transactions(user_id)
+
+    snapshot = db.session.get(InsightSnapshot, user_id) or InsightSnapshot(user_id=user_id)
+    snapshot.data_version = data_version
+    snapshot.computed_on = date.today()
+    snapshot.insights = generate_insights(user_id, df)
+    snapshot.health_score = get_financial_health_score(user_id, df)
+    snapshot.computed_at = datetime.utcnow()
+
+    db.session.add(snapshot)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another process stored a snapshot first; theirs is as good as ours
+        db.session.rollback()
+    return snapshot
+
+def _refresh(user_id):
+    try:
+        with app.app_context():
+            compute_snapshot(user_id)
+    except Exception as e:
+        logging.error(f"Insight snapshot error for user {user_id}: {e}")
+    finally:
+        with _pending_lock:
+            _pending.discard(user_id)
+
+def schedule_refresh(user_id):
+    """Queue a background recompute of a user's snapshot"""
+    with _pending_lock:
+        if user_id in _pending:
+            return
+        _pending.add(user_id)
+    _executor.submit(_refresh, user_id)
+
+def get_insight_snapshot(user_id, data_version):
+    """
+    Return a user's stored insights and whether they reflect the current data.
+
+    A stale snapshot is served as-is while a recompute runs in the
+    background. A user without any snapshot gets None while the first one
+    is computed in the background.
+    """
+    snapshot = db.session.get(InsightSnapshot, user_id)
+    if snapshot is not None and snapshot.is_current(data_version, date.today()):
+        return snapshot, True
+
+    schedule_refresh(user_id)
+    return snapshot, False
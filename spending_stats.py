@@ -0,0 +1,279 @@
+"""
+Running weekly spending statistics for unusual-spending alerts.
+
+Each category's expenses are summed per week (WeeklySpending), and the
+count, mean and variance of those weekly sums are kept with Welford's
+algorithm (SpendingStats). Adding or deleting a transaction changes one
+week's sum, so the statistics are updated by removing the old sum and
+adding the new one -- O(1) per transaction instead of regrouping the whole
+history. Like the monthly rollup, everything is updated in the caller's
+database transaction.
+"""
+import logging
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import insert, tuple_
+from app import db
+from models import Transaction, WeeklySpending, SpendingStats, SpendingAlert
+
+# A week is unusual when it exceeds the category's other weeks by this
+# ratio and by this many standard deviations
+UNUSUAL_RATIO = 1.5
+UNUSUAL_DEVIATIONS = 2.0
+
+# Weeks of history needed before a category can be unusual
+MIN_WEEKS = 4
+
+def week_start(value: date) -> date:
+    """Return the Monday of the week a date falls in."""
+    return value - timedelta(days=value.weekday())
+
+def summarize_weeks(rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    Group expenses into weekly sums.
+
+    Args:
+        rows: Frame with user_id, date, amount and category columns
+
+    Returns:
+        Frame with user_id, category, week_start, total and count columns
+    """
+    expenses = rows[rows['amount'].astype(float) < 0]
+    dates = pd.to_datetime(expenses['date'])
+    frame = pd.DataFrame({
+        'user_id': expenses['user_id'].astype(int),
+        'category': expenses['category'],
+        'week_start': (dates - pd.to_timedelta(dates.dt.weekday, unit='D')).dt.date,
+        'total': -expenses['amount'].astype(float),
+        'count': 1,
+    })
+    return frame.groupby(['user_id', 'category', 'week_start'], as_index=False, sort=False).sum()
+
+def _add(stats: SpendingStats, value: float) -> None:
+    stats.weeks += 1
+    delta = value - stats.mean
+    stats.mean += delta / stats.weeks
+    stats.m2 += delta * (value - stats.mean)
+
+def _remove(stats: SpendingStats, value: float) -> None:
+    if stats.weeks <= 1:
+        stats.weeks, stats.mean, stats.m2 = 0, 0.0, 0.0
+        return
+    mean = (stats.weeks * stats.mean - value) / (stats.weeks - 1)
+    stats.m2 = max(stats.m2 - (value - mean) * (value - stats.mean), 0.0)
+    stats.mean = mean
+    stats.weeks -= 1
+
+def update_spending_stats(rows: pd.DataFrame, sign: int = 1) -> List[Tuple[int, str, date]]:
+    """
+    Add transactions to the weekly statistics, or remove them with sign=-1.
+
+    Args:
+        rows: Frame with user_id, date, amount and category columns
+        sign: 1 for inserted transactions, -1 for deleted ones
+
+    Returns:
+        The (user_id, category, week_start) weeks that changed
+    """
+    if rows.empty:
+        return []
+    weeks = summarize_weeks(rows)
+    if weeks.empty:
+        return []
+
+    keys = list(zip(weeks['user_id'].tolist(), weeks['category'].tolist(), weeks['week_start'].tolist()))
+    pairs = list({(user_id, category) for user_id, category, _ in keys})
+
+    existing_weeks = {
+        (week.user_id, week.category, week.week_start): week
+        for week in WeeklySpending.query.filter(
+            tuple_(WeeklySpending.user_id, WeeklySpending.category, WeeklySpending.week_start).in_(keys)
+        ).with_for_update()
+    }
+    existing_stats = {
+        (stats.user_id, stats.category): stats
+        for stats in SpendingStats.query.filter(
+            tuple_(SpendingStats.user_id, SpendingStats.category).in_(pairs)
+        ).with_for_update()
+    }
+
+    for key, total, count in zip(keys, weeks['total'].tolist(), weeks['count'].tolist()):
+        stats = existing_stats.get(key[:2])
+        if stats is None:
+            stats = SpendingStats(user_id=key[0], category=key[1], weeks=0, mean=0.0, m2=0.0)
+            existing_stats[key[:2]] = stats
+            db.session.add(stats)
+
+        week = existing_weeks.get(key)
+        if week is None:
+            week = WeeklySpending(user_id=key[0], category=key[1], week_start=key[2], total=0.0, count=0)
+            existing_weeks[key] = week
+            db.session.add(week)
+        elif week.count > 0:
+            _remove(stats, week.total)
+
+        week.total += sign * total
+        week.count += sign * count
+        if week.count > 0:
+            _add(stats, week.total)
+
+    db.session.flush()
+
+    if sign < 0:
+        # Weeks and categories without expenses left are removed
+        user_ids = list({user_id for user_id, _ in pairs})
+        WeeklySpending.query.filter(
+            WeeklySpending.user_id.in_(user_ids), WeeklySpending.count <= 0
+        ).delete(synchronize_session=False)
+        SpendingStats.query.filter(
+            SpendingStats.user_id.in_(user_ids), SpendingStats.weeks <= 0
+        ).delete(synchronize_session=False)
+
+    return keys
+
+def update_transaction_stats(transaction: Transaction, sign: int = 1) -> List[Tuple[int, str, date]]:
+    """Add or remove a single transaction from the weekly statistics."""
+    return update_spending_stats(pd.DataFrame([{
+        'user_id': transaction.user_id,
+        'date': transaction.date,
+        'amount': transaction.amount,
+        'category': transaction.category
+    }]), sign)
+
+def unusual_spending(user_id: int, week: date, categories: Optional[Iterable[str]] = None) -> List[Dict]:
+    """
+    Find categories whose spending in a week is unusually high.
+
+    The week is compared against the category's other weeks, which the
+    running statistics give without reading them.
+
+    Args:
+        user_id: User to check
+        week: Monday of the week to check
+        categories: Only check these categories
+
+    Returns:
+        List of dicts with category, total and usual weekly spending
+    """
+    query = db.session.query(WeeklySpending, SpendingStats).join(
+        SpendingStats,
+        (SpendingStats.user_id == WeeklySpending.user_id) & (SpendingStats.category == WeeklySpending.category)
+    ).filter(WeeklySpending.user_id == user_id, WeeklySpending.week_start == week)
+    if categories is not None:
+        query = query.filter(WeeklySpending.category.in_(list(categories)))
+
+    unusual = []
+    for spending, stats in query:
+        # Take this week out of the statistics to get its baseline
+        baseline = SpendingStats(weeks=stats.weeks, mean=stats.mean, m2=stats.m2)
+        _remove(baseline, spending.total)
+        if baseline.weeks < MIN_WEEKS:
+            continue
+        threshold = max(baseline.mean * UNUSUAL_RATIO, baseline.mean + UNUSUAL_DEVIATIONS * baseline.variance ** 0.5)
+        if spending.total > threshold:
+            unusual.append({'category': spending.category, 'total': spending.total, 'usual': baseline.mean})
+    return unusual
+
+def _alert_statement():
+    """INSERT that skips alerts already raised by a concurrent import."""
+    table = SpendingAlert.__table__
+    dialect = db.engine.dialect.name
+
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return insert(table)
+
+    return dialect_insert(table).on_conflict_do_nothing(index_elements=['user_id', 'category', 'week_start'])
+
+def check_spending_alerts(weeks: List[Tuple[int, str, date]], today: Optional[date] = None) -> int:
+    """
+    Raise alerts for changed weeks that are now unusual.
+
+    Only the current week is checked, so importing old statements does not
+    raise alerts about the past. Each category raises one alert per week.
+
+    Args:
+        weeks: Changed weeks, as returned by update_spending_stats
+        today: Date that decides the current week
+
+    Returns:
+        Number of alerts raised
+    """
+    current = week_start(today or date.today())
+    categories = {}
+    for user_id, category, week in weeks:
+        if week == current:
+            categories.setdefault(user_id, set()).add(category)
+
+    records = []
+    for user_id, user_categories in categories.items():
+        unusual = unusual_spending(user_id, current, user_categories)
+        if not unusual:
+            continue
+        alerted = {alert.category for alert in SpendingAlert.query.filter_by(user_id=user_id, week_start=current)}
+        records.extend(
+            dict(user_id=user_id, week_start=current, **alert)
+            for alert in unusual if alert['category'] not in alerted
+        )
+
+    if records:
+        db.session.execute(_alert_statement(), records)
+        logging.info(f"Raised {len(records)} spending alerts")
+    return len(records)
+
+def rebuild_spending_stats(user_id: Optional[int] = None) -> int:
+    """
+    Recompute weekly spending and its statistics from raw transactions.
+
+    Args:
+        user_id: Rebuild only this user, or every user when None
+
+    Returns:
+        Number of categories with statistics
+    """
+    query = db.select(Transaction.user_id, Transaction.date, Transaction.amount, Transaction.category).where(
+        Transaction.amount < 0
+    )
+    if user_id is not None:
+        query = query.where(Transaction.user_id == user_id)
+    weeks = summarize_weeks(pd.read_sql(query, db.session.connection()))
+
+    grouped = weeks.groupby(['user_id', 'category'])['total']
+    stats = pd.DataFrame({
+        'weeks': grouped.count(),
+        'mean': grouped.mean(),
+        'm2': grouped.var(ddof=0) * grouped.count(),
+    }).reset_index()
+
+    try:
+        for model in (WeeklySpending, SpendingStats):
+            existing = model.query
+            if user_id is not None:
+                existing = existing.filter(model.user_id == user_id)
+            existing.delete(synchronize_session=False)
+        if not weeks.empty:
+            db.session.execute(insert(WeeklySpending.__table__), weeks.to_dict('records'))
+            db.session.execute(insert(SpendingStats.__table__), stats.to_dict('records'))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    logging.info(f"Rebuilt spending statistics for {len(stats)} categories" + (f" of user {user_id}" if user_id else ""))
+    return len(stats)
+
+def rebuild_if_empty() -> Optional[int]:
+    """
+    Build the statistics for databases that have expenses from before they existed.
+
+    Returns:
+        Number of categories with statistics, or None if nothing needed building
+    """
+    if SpendingStats.query.first() is None and Transaction.query.filter(Transaction.amount < 0).first() is not None:
+        return rebuild_spending_stats()
+    return None
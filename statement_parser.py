@@ -0,0 +1,208 @@
+"""
+Reading, validating and fingerprinting statement files.
+
+Nothing here touches the app or the database, so zip import workers run
+this module alone rather than importing the app, its routes and its
+startup work in every worker process.
+"""
+import io
+import os
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+REQUIRED_COLUMNS = ['date', 'amount', 'description']
+
+# Upload file extensions and the reader used for each
+IMPORT_FORMATS = {
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+    '.ipc': 'arrow',
+    '.zip': 'zip',
+}
+
+# Length of the transaction description column
+MAX_DESCRIPTION_LENGTH = 200
+
+def missing_columns(df: pd.DataFrame) -> List[str]:
+    """Return the required columns that are missing from a frame."""
+    return [col for col in REQUIRED_COLUMNS if col not in df.columns]
+def guess_date_format(values: pd.Series) -> Optional[str]:
+    """Guess the strftime format of a date column from its first value."""
+    first_valid = values.first_valid_index()
+    if first_valid is None:
+        return None
+    return guess_datetime_format(str(values[first_valid]).strip())
+def parse_dates(values: pd.Series, date_format: Optional[str] = None) -> pd.Series:
+    """
+    Parse a date column, inferring the format once for the whole column.
+
+    Values that do not match the inferred format are parsed individually
+    as a fallback, so mixed-format files still import.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        # Typed columns from Parquet or Arrow need no parsing
+        if getattr(values.dt, 'tz', None) is not None:
+            values = values.dt.tz_localize(None)
+        return values
+
+    text = values.astype(str).str.strip()
+    if date_format is None:
+        date_format = guess_date_format(values)
+
+    if date_format:
+        parsed = pd.to_datetime(text, format=date_format, errors='coerce')
+    else:
+        parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+
+    unparsed = parsed.isna() & values.notna()
+    if unparsed.any():
+        parsed[unparsed] = pd.to_datetime(text[unparsed], format='mixed', errors='coerce')
+
+    return parsed
+def fingerprint_rows(rows: pd.DataFrame, seen: Optional[Dict[str, int]] = None) -> Tuple[pd.Series, pd.Series]:
+    """
+    Fingerprint prepared rows and number repeats of the same fingerprint.
+
+    Args:
+        rows: Frame with user_id, date, amount and description columns
+        seen: Occurrences already counted earlier in the same file; updated
+            in place so numbering continues across chunks
+
+    Returns:
+        Tuple of fingerprint and occurrence Series aligned with rows
+    """
+    if seen is None:
+        seen = {}
+
+    normalized = rows['description'].str.lower().str.split().str.join(' ')
+    keys = (rows['user_id'].astype(str) + '|' + rows['date'].map(lambda d: d.isoformat()) + '|' +
+            rows['amount'].map('{:.2f}'.format) + '|' + normalized)
+    fingerprints = pd.Series(
+        [hashlib.blake2b(key.encode(), digest_size=16).hexdigest() for key in keys],
+        index=rows.index, dtype=object
+    )
+
+    earlier = fingerprints.map(seen).fillna(0).astype(int)
+    occurrences = fingerprints.groupby(fingerprints).cumcount() + 1 + earlier
+
+    for fingerprint, count in fingerprints.value_counts().items():
+        seen[fingerprint] = seen.get(fingerprint, 0) + count
+
+    return fingerprints, occurrences
+def clean_transactions(df: pd.DataFrame, user_id: int, start_row: int = 0,
+                       date_format: Optional[str] = None,
+                       seen: Optional[Dict[str, int]] = None) -> Tuple[pd.DataFrame, List[str]]:
+    """
+    Validate a frame of raw transactions and fingerprint the valid rows.
+
+    Args:
+        df: Frame with date, amount and description columns
+        user_id: Owner of the transactions
+        start_row: Offset added to row numbers in error messages
+        date_format: Date format to use instead of guessing one
+        seen: Fingerprint occurrences from earlier chunks of the same file
+
+    Returns:
+        Tuple of a frame of valid rows, without categories, and a list of
+        (row number, message) errors
+    """
+    dates = parse_dates(df['date'], date_format)
+    amounts = pd.to_numeric(df['amount'], errors='coerce')
+    descriptions = df['description'].fillna('').astype(str).str.strip()
+
+    row_numbers = pd.Series(range(start_row + 1, start_row + len(df) + 1), index=df.index)
+    checks = [
+        (dates.isna(), 'Invalid date', df['date']),
+        (amounts.isna(), 'Invalid amount', df['amount']),
+        (descriptions == '', 'Empty description', None),
+        (descriptions.str.len() > MAX_DESCRIPTION_LENGTH,
+         f'Description longer than {MAX_DESCRIPTION_LENGTH} characters', None),
+    ]
+
+    invalid = pd.Series(False, index=df.index)
+    errors = []
+    for mask, message, values in checks:
+        mask = mask & ~invalid
+        invalid |= mask
+        for index in mask[mask].index:
+            detail = message if values is None else f"{message} '{values[index]}'"
+            errors.append((int(row_numbers[index]), detail))
+
+    valid = ~invalid
+    rows = pd.DataFrame({
+        'user_id': user_id,
+        'date': dates[valid].dt.date,
+        'amount': amounts[valid].astype(float),
+        'description': descriptions[valid]
+    })
+    rows['fingerprint'], rows['occurrence'] = fingerprint_rows(rows, seen)
+
+    return rows, sorted(errors)
+def file_format(filename: Optional[str]) -> Optional[str]:
+    """Return the import format for a filename, or None if it is not supported."""
+    extension = os.path.splitext(filename or '')[1].lower()
+    return IMPORT_FORMATS.get(extension)
+def columnar_available() -> bool:
+    """Check whether pyarrow is installed for Parquet and Arrow files."""
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+def record_batches(stream, file_format: str, batch_size: int):
+    """Yield frames from a Parquet or Arrow IPC file one record batch at a time."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if file_format == 'parquet':
+        parquet_file = pq.ParquetFile(stream)
+        present = [column for column in REQUIRED_COLUMNS if column in parquet_file.schema_arrow.names]
+        batches = parquet_file.iter_batches(batch_size=batch_size, columns=present)
+    else:
+        try:
+            reader = pa.ipc.open_file(stream)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        except pa.ArrowInvalid:
+            # Arrow streaming format rather than the random access file format
+            stream.seek(0)
+            batches = pa.ipc.open_stream(stream)
+
+    for batch in batches:
+        # Arrow batches may be larger than batch_size, so slice them (zero-copy)
+        for offset in range(0, batch.num_rows, batch_size):
+            yield batch.slice(offset, batch_size).to_pandas(date_as_object=False)
+def read_member(data: bytes, member_format: str) -> pd.DataFrame:
+    """Read a whole archive member into a frame."""
+    if member_format == 'csv':
+        try:
+            return pd.read_csv(io.BytesIO(data))
+        except pd.errors.EmptyDataError:
+            raise ValueError('File is empty.')
+
+    if not columnar_available():
+        raise ValueError('Parquet and Arrow files require pyarrow to be installed.')
+
+    import pyarrow as pa
+    try:
+        frames = list(record_batches(pa.BufferReader(data), member_format, len(data) or 1))
+    except pa.ArrowException as e:
+        raise ValueError(f'Not a valid {member_format.title()} file: {e}')
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=REQUIRED_COLUMNS)
+def parse_member(name: str, data: bytes, user_id: int) -> Tuple[Optional[pd.DataFrame], List[Tuple[int, str]]]:
+    """Read, validate and fingerprint one archive member in a worker process."""
+    try:
+        df = read_member(data, file_format(name))
+        missing = missing_columns(df)
+        if missing:
+            raise ValueError(f'File must contain columns: {", ".join(missing)}')
+    except ValueError as e:
+        return None, [(0, f'{name}: {e}')]
+
+    # Occurrences are numbered per member so overlapping statements merge
+    rows, row_errors = clean_transactions(df, user_id)
+    return rows, [(row, f'{name}: {message}') for row, message in row_errors]
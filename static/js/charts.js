@@ -152,6 +152,16 @@ function createMonthlyChart(ctx, data) {
     });
 }
 
+// Income vs Expenses over server-bucketed time periods
+function createTimeSeriesChart(ctx, data) {
+    const chart = createMonthlyChart(ctx, data.buckets);
+    if (data.resolution) {
+        chart.options.scales.x.title.text = data.resolution.charAt(0).toUpperCase() + data.resolution.slice(1);
+        chart.update('none');
+    }
+    return chart;
+}
+
 // Category Spending Chart
 function createCategoryChart(ctx, data) {
     const categoryLabels = Object.keys(data);
@@ -480,6 +490,58 @@ function initializeCharts() {
     }
 }
 
+// Charts whose data is fetched from the server after the page renders
+const chartFactories = {
+    monthly: createMonthlyChart,
+    timeseries: createTimeSeriesChart,
+    category: createCategoryChart
+};
+const chartInstances = {};
+const chartETags = {};
+
+function loadChart(canvas) {
+    const headers = {};
+    if (chartETags[canvas.id]) {
+        headers['If-None-Match'] = chartETags[canvas.id];
+    }
+    
+    return fetch(canvas.dataset.chartUrl, { credentials: 'same-origin', headers: headers })
+        .then(response => {
+            if (response.status === 304) {
+                return null;  // Unchanged since the last load
+            }
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            chartETags[canvas.id] = response.headers.get('ETag');
+            return response.json();
+        })
+        .then(data => {
+            if (data === null) {
+                return false;
+            }
+            if (chartInstances[canvas.id]) {
+                chartInstances[canvas.id].destroy();
+            }
+            chartInstances[canvas.id] = chartFactories[canvas.dataset.chartType](canvas.getContext('2d'), data);
+            return true;
+        });
+}
+
+function refreshChartData(chartId) {
+    const canvas = document.getElementById(chartId);
+    if (!canvas || !canvas.dataset.chartUrl) {
+        return Promise.resolve(false);
+    }
+    return loadChart(canvas);
+}
+
+function initializeLazyCharts() {
+    document.querySelectorAll('canvas[data-chart-url]').forEach(canvas => {
+        loadChart(canvas).catch(error => console.error(`Error loading ${canvas.id}:`, error));
+    });
+}
+
 // Chart animation utilities
 function animateChart(chart) {
     chart.update('active');
@@ -494,12 +556,14 @@ function refreshAllCharts() {
 // Export functions
 window.ChartUtils = {
     createMonthlyChart,
+    createTimeSeriesChart,
     createCategoryChart,
     createGoalProgressChart,
     createDebtChart,
     createSpendingTrendChart,
     createBudgetChart,
     initializeCharts,
+    refreshChartData,
     animateChart,
     refreshAllCharts,
     colors,
@@ -510,3 +574,8 @@ window.ChartUtils = {
 document.addEventListener('DOMContentLoaded', function() {
     initializeCharts();
 });
+
+// Fetch chart data once the page has painted
+window.addEventListener('load', function() {
+    requestAnimationFrame(initializeLazyCharts);
+});
@@ -20,6 +20,9 @@ function initializeDashboard() {
     
     // Initialize auto-save features
     initializeAutoSave();
+    
+    // Load older transactions as the table scrolls into view
+    initializeTransactionScroll();
 }
 
 // Tooltip initialization
@@ -123,15 +126,105 @@ function initializeChartRefresh() {
 
 function refreshChart(chartId) {
     const chartElement = document.getElementById(chartId);
-    if (chartElement) {
+    if (chartElement && window.ChartUtils) {
         chartElement.style.opacity = '0.5';
         
-        // Simulate chart refresh
-        setTimeout(() => {
-            chartElement.style.opacity = '1';
-            showNotification('Chart refreshed successfully!', 'success');
-        }, 1000);
+        // Revalidate against the server; unchanged data comes back as 304
+        window.ChartUtils.refreshChartData(chartId)
+            .then(() => showNotification('Chart refreshed successfully!', 'success'))
+            .catch(() => showNotification('Could not refresh chart.', 'danger'))
+            .finally(() => {
+                chartElement.style.opacity = '1';
+            });
+    }
+}
+
+// Infinite scroll for the transactions table
+function initializeTransactionScroll() {
+    const rows = document.getElementById('transactionRows');
+    const sentinel = document.getElementById('transactionsSentinel');
+    // initializeDashboard can run twice, so only attach one observer
+    if (!rows || !sentinel || !rows.dataset.cursor || rows.dataset.scrollInitialized) {
+        return;
     }
+    rows.dataset.scrollInitialized = 'true';
+    
+    let loading = false;
+    const observer = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting) && !loading) {
+            loading = true;
+            loadMoreTransactions(rows).then(hasMore => {
+                loading = false;
+                if (!hasMore) {
+                    observer.disconnect();
+                    sentinel.remove();
+                }
+            });
+        }
+    }, { rootMargin: '200px' });
+    
+    observer.observe(sentinel);
+}
+
+function loadMoreTransactions(rows) {
+    const url = `${rows.dataset.url}?cursor=${encodeURIComponent(rows.dataset.cursor)}`;
+    
+    return fetch(url, { credentials: 'same-origin' })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(page => {
+            page.transactions.forEach(transaction => rows.appendChild(createTransactionRow(rows, transaction)));
+            rows.dataset.cursor = page.next_cursor || '';
+            return Boolean(page.next_cursor);
+        })
+        .catch(error => {
+            console.error('Error loading transactions:', error);
+            showNotification('Could not load more transactions.', 'danger');
+            return false;
+        });
+}
+
+function createTransactionRow(rows, transaction) {
+    const row = document.createElement('tr');
+    const [year, month, day] = transaction.date.split('-');
+    const description = transaction.description.length > 40
+        ? `${transaction.description.slice(0, 40)}...`
+        : transaction.description;
+    
+    row.insertCell().textContent = `${month}/${day}/${year}`;
+    
+    const descriptionSpan = document.createElement('span');
+    descriptionSpan.className = 'transaction-description';
+    descriptionSpan.textContent = description;
+    row.insertCell().appendChild(descriptionSpan);
+    
+    const categoryBadge = document.createElement('span');
+    categoryBadge.className = 'badge bg-secondary';
+    categoryBadge.textContent = transaction.category;
+    row.insertCell().appendChild(categoryBadge);
+    
+    const amount = document.createElement('span');
+    amount.className = `amount ${transaction.amount > 0 ? 'text-success' : 'text-danger'}`;
+    amount.textContent = `${transaction.amount > 0 ? '+' : ''}$${transaction.amount.toFixed(2)}`;
+    row.insertCell().appendChild(amount);
+    
+    const form = document.createElement('form');
+    form.method = 'POST';
+    form.action = rows.dataset.deleteUrl.replace(/0$/, transaction.id);
+    form.style.display = 'inline';
+    form.innerHTML = '<button type="submit" class="btn btn-sm btn-outline-danger"><i class="fas fa-trash"></i></button>';
+    form.querySelector('button').addEventListener('click', event => {
+        if (!confirm('Are you sure you want to delete this transaction?')) {
+            event.preventDefault();
+        }
+    });
+    row.insertCell().appendChild(form);
+    
+    return row;
 }
 
 // Auto-save functionality
@@ -231,12 +324,6 @@ function handleFileUpload() {
                     return;
                 }
                 
-                if (file.size > 16 * 1024 * 1024) {
-                    showNotification('File size must be less than 16MB', 'error');
-                    this.value = '';
-                    return;
-                }
-                
                 // Show file info
                 const fileName = file.name;
                 const fileSize = (file.size / 1024 / 1024).toFixed(2);
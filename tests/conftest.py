@@ -0,0 +1,47 @@
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The app is configured from the environment when it is first imported
+WORKDIR = tempfile.mkdtemp(prefix='financial-dashboard-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ['CATEGORIZER_MODEL_PATH'] = os.path.join(WORKDIR, 'categorizer.joblib')
+
+# Models import the app, so it is loaded before any test module
+from app import app as flask_app, db  # noqa: E402
+
+_user_numbers = itertools.count(1)
+
+@pytest.fixture(scope='session')
+def app():
+    return flask_app
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+        db.session.remove()
+
+@pytest.fixture
+def user(app_context):
+    from models import User
+
+    number = next(_user_numbers)
+    user = User(username=f'user{number}', email=f'user{number}@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+@pytest.fixture
+def client(app, user):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+    return client
@@ -0,0 +1,57 @@
+import pandas as pd
+
+import categorizer
+import ml_categorizer
+
+class _FixedModel:
+    """Stands in for a trained model that confidently predicts one category."""
+
+    def __init__(self, category):
+        self.category = category
+
+def _use_model(monkeypatch, category):
+    model = _FixedModel(category)
+    monkeypatch.setattr(ml_categorizer, 'get_model', lambda *args, **kwargs: model)
+    monkeypatch.setattr(ml_categorizer, 'model_version', lambda: ('fixed', category))
+    monkeypatch.setattr(ml_categorizer, 'predict_categories',
+                        lambda descriptions, model: pd.Series(model.category, index=descriptions.index))
+    categorizer.clear_categorization_cache()
+
+def test_user_rules_are_layered_on_global_rules(user):
+    # The exact user match (10) outscores the global 'uber' word match (5)
+    categorizer.add_custom_category_rule('Shopping', ['uber ride'], user_id=user.id)
+    assert categorizer.categorize_transaction('Uber ride', user_id=user.id) == 'Shopping'
+    assert categorizer.categorize_transaction('Uber ride') == 'Transportation'
+
+    # A weak user rule does not beat a stronger global match
+    categorizer.add_custom_category_rule('Education', ['coffee beans'], user_id=user.id)
+    scores = categorizer.load_rules(user.id)[1].score('starbucks coffee beans')
+    assert scores['Education'] == 5 and scores['Food & Dining'] == 10
+    assert categorizer.categorize_transaction('Starbucks coffee beans', user_id=user.id) == 'Food & Dining'
+
+def test_matching_user_rule_overrides_model(user, monkeypatch):
+    categorizer.add_custom_category_rule('Shopping', ['uber ride'], user_id=user.id)
+    _use_model(monkeypatch, 'Entertainment')
+
+    descriptions = pd.Series(['Uber ride', 'Lyft downtown'])
+    assert categorizer.categorize_many(descriptions, user_id=user.id).tolist() == ['Shopping', 'Entertainment']
+    assert categorizer.categorize_transaction('Uber ride', user_id=user.id) == 'Shopping'
+    assert categorizer.categorize_transaction('Lyft downtown', user_id=user.id) == 'Entertainment'
+
+def test_loaded_rules_avoid_a_query_per_call(user, app):
+    from sqlalchemy import event
+    from app import db
+
+    categorizer.add_custom_category_rule('Shopping', ['uber ride'], user_id=user.id)
+    rules = categorizer.load_rules(user.id)
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        categories = [categorizer.categorize_transaction(d, rules=rules) for d in ['Uber ride', 'Cafe', 'Rent']]
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+    assert categories[0] == 'Shopping'
+    assert statements == []
@@ -0,0 +1,27 @@
+import io
+import sys
+
+import pytest
+
+from importer import import_columnar_stream
+
+@pytest.fixture
+def without_pyarrow(monkeypatch):
+    # A None entry makes `import pyarrow` raise ImportError
+    for name in ('pyarrow', 'pyarrow.parquet', 'pyarrow.feather'):
+        monkeypatch.setitem(sys.modules, name, None)
+
+def test_columnar_import_is_rejected(user, without_pyarrow):
+    with pytest.raises(ValueError, match='require pyarrow'):
+        import_columnar_stream(io.BytesIO(b'PAR1'), user.id, 'parquet')
+
+def test_columnar_upload_and_export_are_rejected(client, without_pyarrow):
+    response = client.post('/upload/stream?filename=march.parquet', data=b'PAR1')
+    assert response.status_code == 400
+    assert 'require pyarrow' in response.get_json()['error']
+
+    response = client.post('/generate_report', data={
+        'start_date': '2024-01-01', 'end_date': '2024-12-31', 'report_type': 'parquet'
+    }, follow_redirects=True)
+    assert response.status_code == 200
+    assert b'Parquet and Arrow exports require pyarrow to be installed.' in response.data
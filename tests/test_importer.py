@@ -0,0 +1,82 @@
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+from models import Transaction
+from importer import import_csv_stream
+
+# Two exports concatenated: the second goes back in date and repeats a
+# genuine double purchase from the first
+UNSORTED_CSV = b'''date,amount,description
+2024-01-01,-4.50,Coffee shop
+2024-01-01,-4.50,Coffee shop
+2024-01-02,-20.00,Grocery store
+2024-01-01,-4.50,Coffee shop
+2024-01-03,-9.99,Streaming service
+2024-01-02,-20.00,Grocery store
+'''
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 4, 100])
+def test_chunk_size_does_not_change_what_is_stored(user, chunk_size):
+    added, duplicates, failed, errors = import_csv_stream(io.BytesIO(UNSORTED_CSV), user.id, chunk_size=chunk_size)
+
+    assert (added, duplicates, failed, errors) == (6, 0, 0, [])
+    assert Transaction.query.filter_by(user_id=user.id).count() == 6
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 100])
+def test_reimport_only_finds_duplicates(user, chunk_size):
+    import_csv_stream(io.BytesIO(UNSORTED_CSV), user.id, chunk_size=100)
+    added, duplicates, _, _ = import_csv_stream(io.BytesIO(UNSORTED_CSV), user.id, chunk_size=chunk_size)
+
+    assert (added, duplicates) == (0, 6)
+
+# Run as the main script of a fresh interpreter that, like gunicorn's, does
+# not import the app at the top level
+ARCHIVE_SCRIPT = '''
+import io
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+def statement(month):
+    return ('date,amount,description\\n' + '\\n'.join(
+        f'2024-{month:02d}-{day:02d},-{day}.10,Grocery store' for day in range(1, 11))).encode()
+
+if __name__ == '__main__':
+    from app import app, db
+    from models import User
+    from importer import import_zip_archive
+    from statement_parser import parse_member
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        for month in (1, 2, 3):
+            zf.writestr(f'{month:02d}.csv', statement(month))
+    archive.seek(0)
+
+    with app.app_context():
+        user = User(username='zip', email='zip@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        print(import_zip_archive(archive, user.id, workers=2)[:3])
+
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('forkserver')) as pool:
+        pool.submit(parse_member, '01.csv', statement(1), 1).result()
+        print(pool.submit(eval, "sorted(set(__import__('sys').modules) & {'app', 'routes', 'jobs', 'importer'})").result())
+'''
+
+def test_zip_workers_do_not_import_the_app(tmp_path):
+    script = tmp_path / 'run_archive.py'
+    script.write_text(ARCHIVE_SCRIPT)
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'archive.db'}", PYTHONPATH=ROOT)
+
+    result = subprocess.run([sys.executable, str(script)], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=120)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines() == ['(30, 0, 0)', '[]']
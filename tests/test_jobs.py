@@ -0,0 +1,54 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from models import ImportJob, Transaction
+from jobs import fail_stalled_jobs, job_status, STALLED_ERROR
+
+CSV = b'date,amount,description\n' + b'\n'.join(
+    b'2024-03-%02d,-%d.25,Grocery store %d' % (day, day, day) for day in range(1, 29)
+)
+
+def _wait(client, status_url):
+    for _ in range(100):
+        status = client.get(status_url).get_json()
+        if status['finished']:
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f'Import did not finish: {status}')
+
+@pytest.mark.parametrize('spool_size', [1024 * 1024, 64])
+def test_stream_upload_is_imported_in_the_background(app, client, user, spool_size, monkeypatch):
+    # Bodies beyond IMPORT_SPOOL_SIZE are spooled to a temp file instead of memory
+    monkeypatch.setitem(app.config, 'IMPORT_SPOOL_SIZE', spool_size)
+
+    response = client.post('/upload/stream?filename=march.csv', data=CSV, content_type='text/csv')
+    assert response.status_code == 202
+
+    status = _wait(client, response.get_json()['status_url'])
+    assert status['status'] == 'completed'
+    assert status['rows_added'] == 28
+    assert Transaction.query.filter_by(user_id=user.id).count() == 28
+
+def test_lost_queued_and_running_jobs_are_failed(user):
+    old = datetime.utcnow() - timedelta(hours=2)
+    jobs = {
+        'queued': ImportJob(user_id=user.id, status='queued', created_at=old),
+        'running': ImportJob(user_id=user.id, status='running', created_at=old, started_at=old, updated_at=old),
+        'active': ImportJob(user_id=user.id, status='running', created_at=old, started_at=old),
+        'waiting': ImportJob(user_id=user.id, status='queued'),
+    }
+    db.session.add_all(jobs.values())
+    db.session.commit()
+    # A recent progress update keeps a long import alive
+    jobs['active'].updated_at = datetime.utcnow()
+    db.session.commit()
+
+    assert job_status(jobs['queued'])['status'] == 'failed'
+    assert job_status(jobs['waiting'])['finished'] is False
+
+    fail_stalled_jobs()
+    assert [job.status for job in jobs.values()] == ['failed', 'failed', 'running', 'queued']
+    assert jobs['queued'].error == STALLED_ERROR
@@ -0,0 +1,22 @@
+from commands import _hot_queries, explain
+from migrations import MIGRATIONS, pending_migrations, upgrade_database
+from models import SchemaMigration
+
+def test_upgrade_is_a_no_op_once_applied(app_context):
+    # Migrations are recorded even on a database create_all() just built
+    assert {row.version for row in SchemaMigration.query} == {version for version, _ in MIGRATIONS}
+    assert pending_migrations() == []
+    assert upgrade_database() == []
+
+def test_db_upgrade_command(app):
+    result = app.test_cli_runner().invoke(args=['db-upgrade'])
+    assert result.exit_code == 0, result.output
+    assert result.output == 'Database is up to date.\n'
+
+def test_hot_queries_use_their_index(app_context):
+    plans = {name: explain(statement) for name, _, statement in _hot_queries()}
+    missing = [
+        (name, plans[name]) for name, index, _ in _hot_queries()
+        if not any(index in line for line in plans[name])
+    ]
+    assert missing == []
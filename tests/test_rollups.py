@@ -0,0 +1,24 @@
+from datetime import date
+
+from app import db
+from models import MonthlyRollup, SpendingStats, Transaction
+
+def test_rebuild_if_empty_builds_only_missing_tables(app, user):
+    # Transactions from before the rollup existed, as on an upgraded database
+    db.session.add_all([
+        Transaction(user_id=user.id, date=date(2024, 1, 5), amount=-12.5, description='Coffee', category='Food'),
+        Transaction(user_id=user.id, date=date(2024, 1, 20), amount=1000.0, description='Salary', category='Income'),
+    ])
+    MonthlyRollup.query.delete()
+    SpendingStats.query.delete()
+    db.session.commit()
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['rebuild-rollups', '--if-empty'])
+    assert result.exit_code == 0, result.output
+    assert result.output.startswith('Built ')
+    assert MonthlyRollup.query.filter_by(user_id=user.id, year_month='2024-01', category='Food').one().expenses == 12.5
+    assert SpendingStats.query.filter_by(user_id=user.id, category='Food').count() == 1
+
+    result = runner.invoke(args=['rebuild-rollups', '--if-empty'])
+    assert result.output == 'Rollups and spending statistics are already built.\n'
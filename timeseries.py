@@ -0,0 +1,146 @@
+from datetime import date, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import Date, Integer, String, case, cast, func
+from app import db
+from models import Transaction
+
+# Bucket sizes from finest to coarsest; 'auto' picks the finest that fits
+RESOLUTIONS = ['day', 'week', 'month', 'quarter', 'year']
+
+def bucket_start(value: date, resolution: str) -> date:
+    """Return the first day of the bucket a date falls in. Weeks start on Monday."""
+    if resolution == 'day':
+        return value
+    if resolution == 'week':
+        return value - timedelta(days=value.weekday())
+    if resolution == 'month':
+        return value.replace(day=1)
+    if resolution == 'quarter':
+        return value.replace(month=(value.month - 1) // 3 * 3 + 1, day=1)
+    return value.replace(month=1, day=1)
+
+def next_bucket(start: date, resolution: str) -> date:
+    """Return the first day of the bucket after the one starting on start."""
+    if resolution == 'day':
+        return start + timedelta(days=1)
+    if resolution == 'week':
+        return start + timedelta(days=7)
+    months = {'month': 1, 'quarter': 3, 'year': 12}[resolution]
+    index = start.year * 12 + start.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def bucket_count(start_date: date, end_date: date, resolution: str) -> int:
+    """Return how many buckets a date range spans at a resolution."""
+    first, last = bucket_start(start_date, resolution), bucket_start(end_date, resolution)
+    if resolution == 'day':
+        return (last - first).days + 1
+    if resolution == 'week':
+        return (last - first).days // 7 + 1
+    months = (last.year - first.year) * 12 + last.month - first.month
+    return months // {'month': 1, 'quarter': 3, 'year': 12}[resolution] + 1
+
+def choose_resolution(start_date: date, end_date: date, max_points: int) -> str:
+    """
+    Return the finest resolution that keeps a range within max_points buckets.
+
+    Raises:
+        ValueError: If even yearly buckets would exceed max_points
+    """
+    for resolution in RESOLUTIONS:
+        if bucket_count(start_date, end_date, resolution) <= max_points:
+            return resolution
+    raise ValueError(f'The range needs more than {max_points} points even by year; choose a shorter range.')
+
+def _bucket_expression(resolution: str):
+    """SQL expression for the first day of each transaction's bucket."""
+    column = Transaction.date
+
+    if db.engine.dialect.name == 'sqlite':
+        if resolution == 'day':
+            return func.date(column)
+        if resolution == 'week':
+            # Forward to Sunday, then back to the Monday that starts the week
+            return func.date(column, 'weekday 0', '-6 days')
+        if resolution == 'month':
+            return func.strftime('%Y-%m-01', column)
+        if resolution == 'quarter':
+            month = cast(func.strftime('%m', column), Integer)
+            first_month = func.printf('%02d', (month - 1) // 3 * 3 + 1)
+            return func.strftime('%Y-', column, type_=String) + first_month + '-01'
+        return func.strftime('%Y-01-01', column)
+
+    return cast(func.date_trunc(resolution, column), Date)
+
+def _as_date(value) -> date:
+    # SQLite returns text, other databases return dates or timestamps
+    return date.fromisoformat(str(value)[:10])
+
+def get_time_series(user_id: int, start_date: Optional[date] = None, end_date: Optional[date] = None,
+                    resolution: str = 'auto', max_points: int = 60) -> Dict:
+    """
+    Sum income and expenses per time bucket, grouping in the database.
+
+    The payload size depends on max_points rather than on how much history
+    the user has, so ten years of data chart as fast as one.
+
+    Args:
+        user_id: User whose transactions are summed
+        start_date: First day of the range; defaults to the first transaction
+        end_date: Last day of the range; defaults to the last transaction
+        resolution: One of RESOLUTIONS, or 'auto' to fit max_points
+        max_points: Most buckets the series may have
+
+    Returns:
+        Dict with the resolution used, the range and one entry per bucket,
+        including empty ones, keyed by the bucket's first day
+
+    Raises:
+        ValueError: If the range is invalid, the resolution is unknown, or
+        no resolution (or not the one given) fits within max_points
+    """
+    if start_date is None or end_date is None:
+        first, last = db.session.query(func.min(Transaction.date), func.max(Transaction.date)).filter(
+            Transaction.user_id == user_id
+        ).one()
+        if first is None:
+            return {'resolution': None, 'start_date': None, 'end_date': None, 'buckets': {}}
+        start_date = start_date or _as_date(first)
+        end_date = end_date or _as_date(last)
+
+    if start_date > end_date:
+        raise ValueError('The start date must not be after the end date.')
+
+    if resolution == 'auto':
+        resolution = choose_resolution(start_date, end_date, max_points)
+    elif resolution not in RESOLUTIONS:
+        raise ValueError(f"Resolution must be 'auto' or one of {', '.join(RESOLUTIONS)}.")
+    elif bucket_count(start_date, end_date, resolution) > max_points:
+        raise ValueError(f'A {resolution} resolution gives more than {max_points} points for this range.')
+
+    bucket = _bucket_expression(resolution)
+    rows = db.session.query(
+        bucket,
+        func.sum(case((Transaction.amount > 0, Transaction.amount), else_=0.0)),
+        func.sum(case((Transaction.amount < 0, -Transaction.amount), else_=0.0))
+    ).filter(
+        Transaction.user_id == user_id,
+        Transaction.date >= start_date,
+        Transaction.date <= end_date
+    ).group_by(bucket)
+    totals = {_as_date(start): (income or 0, expenses or 0) for start, income, expenses in rows}
+
+    # Fill empty buckets so points are evenly spaced on the chart
+    buckets = {}
+    start = bucket_start(start_date, resolution)
+    while start <= end_date:
+        income, expenses = totals.get(start, (0, 0))
+        buckets[start.isoformat()] = {'income': round(income, 2), 'expenses': round(expenses, 2)}
+        start = next_bucket(start, resolution)
+
+    return {
+        'resolution': resolution,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'buckets': buckets
+    }